@@ -0,0 +1,92 @@
+#!/usr/bin/env python2.7
+"""
+Generates a synthetic mgit workspace: N repositories cloned from local bare "remotes"
+(file:// urls, no network needed) with configurable history depth, branches, dirty
+files and commits ahead/behind their remote.
+"""
+
+import shutil
+import subprocess
+from argparse import ArgumentParser
+from os import path, makedirs
+
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'mgit-bench', 'GIT_AUTHOR_EMAIL': 'bench@mgit',
+    'GIT_COMMITTER_NAME': 'mgit-bench', 'GIT_COMMITTER_EMAIL': 'bench@mgit',
+    'PATH': '/usr/local/bin:/usr/bin:/bin',
+}
+
+
+def git(cwd, *args):
+    """
+    :param str cwd:
+    :param list(str) args:
+    """
+    subprocess.check_call(['git'] + list(args), cwd=cwd, env=GIT_ENV,
+                          stdout=open('/dev/null', 'w'), stderr=subprocess.STDOUT)
+
+
+def commit_files(repo, prefix, n_commits):
+    """
+    :param str repo: Repository folder
+    :param str prefix: Name of the files written by every commit
+    :param int n_commits:
+    """
+    for i in range(n_commits):
+        with open(path.join(repo, '%s-%d.txt' % (prefix, i % 10)), 'a') as stream:
+            stream.write('%s %d\n' % (prefix, i))
+        git(repo, 'add', '-A')
+        git(repo, 'commit', '-q', '-m', '%s %d' % (prefix, i))
+
+
+def generate_workspace(root, n_repos, depth=20, branches=2, dirty=0, behind=0, ahead=0):
+    """
+    Creates `<root>/workspace/repo-<i>` cloned from `<root>/remotes/repo-<i>.git`. Existing
+    content of root is removed.
+    :param str root:
+    :param int n_repos: Number of repositories
+    :param int depth: Commits in every repository history
+    :param int branches: Extra local branches per repository
+    :param int dirty: Number of repositories with uncommitted changes
+    :param int behind: Commits pushed to every remote after cloning (to pull)
+    :param int ahead: Local commits not pushed yet (to push)
+    :return: Workspace folder
+    :rtype: str
+    """
+    if path.isdir(root): shutil.rmtree(root)
+    workspace, remotes = path.join(root, 'workspace'), path.join(root, 'remotes')
+    makedirs(workspace)
+    makedirs(remotes)
+    for i in range(n_repos):
+        name = 'repo-%03d' % i
+        remote, repo = path.join(remotes, name + '.git'), path.join(workspace, name)
+        git(remotes, 'init', '-q', '--bare', remote)
+        git(remote, 'symbolic-ref', 'HEAD', 'refs/heads/master')
+        git(workspace, 'clone', '-q', 'file://' + remote, name)
+        git(repo, 'symbolic-ref', 'HEAD', 'refs/heads/master')
+        commit_files(repo, 'history', depth)
+        git(repo, 'push', '-q', 'origin', 'master')
+        for b in range(branches): git(repo, 'branch', 'feature-%d' % b)
+        if behind:
+            upstream = path.join(root, 'upstream-' + name)
+            git(root, 'clone', '-q', 'file://' + remote, upstream)
+            commit_files(upstream, 'upstream', behind)
+            git(upstream, 'push', '-q', 'origin', 'master')
+            shutil.rmtree(upstream)
+        commit_files(repo, 'local', ahead)
+        if i < dirty:
+            with open(path.join(repo, 'history-0.txt'), 'a') as stream: stream.write('dirty\n')
+    return workspace
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='Generates a synthetic mgit workspace')
+    parser.add_argument('root', help='Folder to generate the workspace and remotes into')
+    parser.add_argument('--repos', type=int, default=50, help='Number of repositories')
+    parser.add_argument('--depth', type=int, default=20, help='Commits per repository')
+    parser.add_argument('--branches', type=int, default=2, help='Extra branches per repository')
+    parser.add_argument('--dirty', type=int, default=0, help='Number of repositories with local changes')
+    parser.add_argument('--behind', type=int, default=0, help='Commits every repository is behind its remote')
+    parser.add_argument('--ahead', type=int, default=0, help='Commits every repository is ahead its remote')
+    args = parser.parse_args()
+    print(generate_workspace(args.root, args.repos, args.depth, args.branches, args.dirty, args.behind, args.ahead))
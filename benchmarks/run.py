@@ -0,0 +1,136 @@
+#!/usr/bin/env python2.7
+"""
+Times mgit on synthetic workspaces (see generate_workspace.py) across repository counts and
+executors, and writes the results as JSON so runs of different versions can be compared.
+
+    $> python benchmarks/run.py --repos 10 50 200 --output bench.json
+"""
+
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from os import path, environ
+
+CUR_DIR = path.dirname(path.realpath(__file__))
+MGIT_DIR = path.dirname(CUR_DIR)
+sys.path.insert(0, MGIT_DIR)
+
+from generate_workspace import generate_workspace
+
+# Command line of every timed scenario, None for the in-process package discovery
+scenarios = {
+    'get_packages': None,
+    'status': ['status', '--all'],
+    'log': ['log', '--all', '-n', '20'],
+    'diff': ['diff', '--all', 'origin/master'],
+    'pull': ['pull', '--all'],
+    'push': ['push', '--all'],
+}
+# Scenarios which change the workspace, it is generated again before every run
+mutating_scenarios = ['pull', 'push']
+
+
+def time_get_packages(workspace):
+    """
+    :param str workspace:
+    :rtype: float
+    """
+    environ.setdefault('prod_branch', 'origin/master')
+    from libs.workspace import Workspace
+    started = time.time()
+    Workspace.get_packages(workspace, all_packages=False, only_local_changes=True, only_no_prod=True,
+                           package_names=[])
+    return time.time() - started
+
+
+def time_mgit(workspace, args, executor, jobs):
+    """
+    :param str workspace:
+    :param list(str) args: mgit command and arguments
+    :param str executor:
+    :param int jobs:
+    :raise RuntimeError: When mgit failed, its timing would be meaningless
+    :rtype: float
+    """
+    cmd = [sys.executable, path.join(MGIT_DIR, 'main.py'), '--ws', workspace, '--executor', executor]
+    if jobs: cmd += ['--jobs', str(jobs)]
+    output = tempfile.TemporaryFile()
+    started = time.time()
+    exit_code = subprocess.call(cmd + args, cwd=workspace, stdout=output, stderr=subprocess.STDOUT)
+    duration = time.time() - started
+    if exit_code != 0:
+        output.seek(0)
+        lines = output.read().strip().split('\n')
+        raise RuntimeError('mgit %s exited with %d: %s' % (' '.join(args), exit_code, lines[-1]))
+    return duration
+
+
+def get_version():
+    """
+    :rtype: str
+    """
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=MGIT_DIR).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='mgit benchmarks')
+    parser.add_argument('--repos', type=int, nargs='+', default=[10, 50], help='Repository counts to benchmark')
+    parser.add_argument('--executors', nargs='+', default=['serial', 'process', 'thread'],
+                        help='Executors to compare')
+    parser.add_argument('--jobs', type=int, default=None, help='--jobs given to mgit')
+    parser.add_argument('--scenarios', nargs='+', default=sorted(scenarios.keys()), choices=sorted(scenarios.keys()))
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measure, the median is reported')
+    parser.add_argument('--depth', type=int, default=20, help='Commits per repository')
+    parser.add_argument('--root', default=None, help='Folder for the generated workspaces (default: temporary)')
+    parser.add_argument('--output', default=None, help='JSON output file (default: stdout)')
+    args = parser.parse_args()
+    root = args.root or tempfile.mkdtemp(prefix='mgit-bench-')
+
+    def generate(n_repos, scenario=None):
+        # Repositories are behind their remote to give pull some work, or ahead of it for push
+        behind, ahead = (0, 2) if scenario == 'push' else (2, 0)
+        return generate_workspace(path.join(root, str(n_repos)), n_repos, depth=args.depth,
+                                  dirty=n_repos // 4, behind=behind, ahead=ahead)
+
+    results = []
+    for n_repos in args.repos:
+        workspace = generate(n_repos)
+        for scenario in args.scenarios:
+            executors = ['serial'] if scenario == 'get_packages' else args.executors
+            for executor in executors:
+                timings, error = [], None
+                try:
+                    for i in range(args.repeat):
+                        if scenario in mutating_scenarios: workspace = generate(n_repos, scenario)
+                        if scenario == 'get_packages': timings.append(time_get_packages(workspace))
+                        else: timings.append(time_mgit(workspace, scenarios[scenario], executor, args.jobs))
+                except RuntimeError as e:
+                    error = str(e)
+                result = {'scenario': scenario, 'executor': executor, 'jobs': args.jobs, 'repos': n_repos}
+                # A failed run is reported as such, never as a timing
+                if error: result['error'] = error
+                else: result.update(timings=timings, median=sorted(timings)[len(timings) // 2])
+                results.append(result)
+                if scenario in mutating_scenarios: workspace = generate(n_repos)
+                if error: sys.stderr.write('%(scenario)-12s %(executor)-8s %(repos)5d repos failed: %(error)s\n' % result)
+                else: sys.stderr.write('%(scenario)-12s %(executor)-8s %(repos)5d repos %(median)8.3fs\n' % result)
+
+    report = json.dumps({
+        'version': get_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'depth': args.depth,
+        'results': results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as stream: stream.write(report)
+    else:
+        print(report)
+    if any('error' in result for result in results): sys.exit(1)
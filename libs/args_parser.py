@@ -1,7 +1,9 @@
 from argparse import ArgumentParser
 from os import environ
 
-available_git_actions = ['log', 'diff', 'status', 'pull', 'push', 'commit', 'checkout', 'clean', 'bash', 'reset', 'merge']
+available_git_actions = ['clone', 'log', 'diff', 'grep', 'status', 'fetch', 'pull', 'push', 'commit', 'checkout', 'clean',
+                         'bash', 'reset', 'merge', 'daemon']
+executors = ['serial', 'process', 'thread']
 
 class AppArgsParser(ArgumentParser):
     @staticmethod
@@ -16,6 +18,30 @@ class AppArgsParser(ArgumentParser):
                             help='use all packages')
         parser.add_argument('--no-prod', action='store_true', dest='no_prod',
                             help='Only use packages on prod(%s) branch' % str(environ.get('prod_branch')))
+        parser.add_argument('--depth', type=int, dest='depth',
+                            help='How many folders deep packages are searched for (default: "discovery.depth" config)')
+        parser.add_argument('--executor', type=str, choices=executors, dest='executor',
+                            help='How packages are run (default: "executor" config)')
+        parser.add_argument('--jobs', '-j', type=int, dest='jobs',
+                            help='Max number of packages running at once')
+        parser.add_argument('--timeout', type=float, dest='timeout',
+                            help='Seconds a package has to complete the command before its git processes are killed, '
+                                 '0 for no limit (default: manifest "timeout", "<command>.timeout" or "timeout" config)')
+        parser.add_argument('--stream', action='store_true', dest='stream',
+                            help='Write log/diff/bash output line by line, prefixed by package, instead of buffering it')
+        parser.add_argument('--profile', action='store_true', dest='profile',
+                            help='Record every git invocation and print where the time went')
+        parser.add_argument('--profile-output', type=str, dest='profile_output',
+                            help='Also write the recorded invocations to this file (implies --profile)')
+        parser.add_argument('--profile-format', type=str, choices=['chrome', 'json'], default='chrome',
+                            dest='profile_format', help='chrome://tracing file, one lane per worker, or raw events')
+        parser.add_argument('--format', type=str, choices=['text', 'json'], default='text', dest='format',
+                            help='json prints a single document with the status, branch, timing and output '
+                                 'of every package once they all complete')
+        parser.add_argument('--plan', action='store_true', dest='plan',
+                            help='Print what pull/push/merge would do on every package without running it')
+        parser.add_argument('--group', type=str, action='append', dest='groups',
+                            help='Use the packages of this manifest group, can be repeated')
         parser.add_argument('--packages', type=str, nargs='+', required=False, dest='packages',
                             help='List of packages to use')
         parser.add_argument("git_cmd", help="Git command", choices=available_git_actions, type=str)
@@ -27,7 +53,11 @@ class GitLogParser(ArgumentParser):
     def create():
         parser = GitLogParser(description='"git log" arguments ', prog='mgit Log')
         # parser.add_argument('git_cmd', nargs='*', help='Git command to execute on every package')
-        parser.add_argument('-n', type=int, dest='-n', default=5)
+        parser.add_argument('-n', type=int, dest='-n',
+                            help='Max commits, 5 by default unless --timeline is given with --since')
+        parser.add_argument('--since', type=str, dest='since', help='Only commits more recent than this date')
+        parser.add_argument('--timeline', action='store_true', dest='timeline',
+                            help='Merge the commits of every package into a single timeline, newest first')
         parser.add_argument('--oneline', type=bool, required=False, dest='oneline')
         parser.add_argument('--pretty',
                             type=str,
@@ -35,10 +65,34 @@ class GitLogParser(ArgumentParser):
                             dest='pretty')
         return parser
 
+class GitGrepParser(ArgumentParser):
+    @staticmethod
+    def create():
+        parser = GitGrepParser(description='"git grep" arguments, followed by the pattern and the revisions to search',
+                               prog='mgit grep')
+        parser.add_argument('-e', dest='pattern', type=str, required=False, help='Pattern, when it starts with "-"')
+        parser.add_argument('-i', dest='-i', action='store_true', required=False, help='Ignore case')
+        parser.add_argument('-w', dest='-w', action='store_true', required=False, help='Match whole words')
+        parser.add_argument('-E', dest='-E', action='store_true', required=False, help='Extended regexp')
+        parser.add_argument('-F', dest='-F', action='store_true', required=False, help='Fixed string')
+        parser.add_argument('-l', dest='-l', action='store_true', required=False,
+                            help='Only the names of the matching files')
+        parser.add_argument('--cached', dest='--cached', action='store_true', required=False,
+                            help='Search the index instead of the working tree')
+        parser.add_argument('--max-matches', dest='max_matches', type=int, default=0,
+                            help='Stop every package once the workspace has this many matches')
+        return parser
+
 class GitStatusParser(ArgumentParser):
     @staticmethod
     def create():
         parser = GitStatusParser(description='"git status" arguments', prog='mgit Status')
+        parser.add_argument('--short', dest='short', action='store_true', required=False,
+                            help='One line per package: branch, upstream, ahead/behind and change counts')
+        parser.add_argument('--untracked-cache', dest='untracked_cache', action='store_true', required=False,
+                            help='Enable git\'s untracked cache (core.untrackedCache) on every package')
+        parser.add_argument('--fsmonitor', dest='fsmonitor', action='store_true', required=False,
+                            help='Enable git\'s file system monitor (core.fsmonitor) when git supports it')
         # parser.add_argument('git_cmd', nargs='*', help='Git command to execute on every package')
         return parser
 
@@ -47,9 +101,36 @@ class GitDiffParser(ArgumentParser):
     def create():
         parser = GitDiffParser(description='"git pull" arguments', prog='mgit Pull')
         parser.add_argument('--color', type=str, default='always')
+        parser.add_argument('--numstat', action='store_true', dest='numstat',
+                            help='Only print the files, insertions and deletions of every package')
         # parser.add_argument('git_cmd', nargs='*', help='Git command to execute on every package')
         return parser
 
+class GitCloneParser(ArgumentParser):
+    @staticmethod
+    def create():
+        parser = GitCloneParser(description='"git clone" arguments, followed by the urls or paths to clone',
+                                prog='mgit clone')
+        parser.add_argument('--from-file', dest='from_file', type=str, required=False,
+                            help='File listing the urls to clone, one per line')
+        parser.add_argument('--reference', dest='reference', type=str, required=False,
+                            help='Borrow objects from this repository (alternates) instead of downloading them')
+        parser.add_argument('--shared', dest='shared', action='store_true', required=False,
+                            help='Borrow the objects of local sources instead of copying them')
+        parser.add_argument('--filter', dest='filter', type=str, required=False,
+                            help='Partial clone filter, e.g. blob:none')
+        parser.add_argument('--branch', dest='branch', type=str, required=False, help='Branch to check out')
+        return parser
+
+class GitFetchParser(ArgumentParser):
+    @staticmethod
+    def create():
+        parser = GitFetchParser(description='"git fetch" arguments, every remote unless one is given',
+                                prog='mgit fetch')
+        parser.add_argument('--prune', dest='prune', action='store_true', required=False,
+                            help='Remove remote branches which no longer exist')
+        return parser
+
 class GitPullParser(ArgumentParser):
     @staticmethod
     def create():
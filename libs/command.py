@@ -0,0 +1,192 @@
+from os import environ
+
+from args_parser import *
+
+stream_commands = ['log', 'diff', 'bash']
+daemon_actions = ['start', 'stop', 'status']
+# Commits `mgit log` shows without -n
+default_log_commits = 5
+
+
+class CommandPlan(object):
+    """
+    A command line compiled once in the parent process: flags parsed and validated, remote and
+    branch resolved. Pool workers only receive this plan, never the raw command line.
+    """
+    git_cmd = None
+    flags = None
+    remote = None
+    branch = None
+    argument = None
+    stream = False
+    timeout = None
+
+    def __init__(self, git_cmd, flags=None, remote=None, branch=None, argument=None, stream=False, timeout=None):
+        """
+        :param str git_cmd:
+        :param dict flags: Parsed flags, only the ones set
+        :param str remote: Requested remote, None for the current one
+        :param str branch: Requested branch, None for the current one
+        :param str|list|dict argument: Commit message, bash command, daemon action, the urls to clone
+            or the git grep arguments
+        :param bool stream:
+        :param float timeout: --timeout, None to take the one of each package
+        """
+        self.git_cmd = git_cmd
+        self.flags = flags or dict()
+        self.remote = remote
+        self.branch = branch
+        self.argument = argument
+        self.stream = stream
+        self.timeout = timeout
+
+    def get_timeout(self, package):
+        """
+        Seconds package has to complete the command: --timeout, otherwise the package "timeout" of
+        the manifest, otherwise the "<command>.timeout" or "timeout" config
+        :param Package package:
+        :return: 0 for no limit
+        :rtype: float
+        """
+        if self.timeout is not None: return self.timeout
+        if package.timeout is not None: return package.timeout
+        return float(environ.get('%s.timeout' % self.git_cmd, environ.get('timeout', 0)))
+
+    def execute(self, package):
+        """
+        :param Package package:
+        :rtype: str|CommandResult
+        """
+        if self.git_cmd not in _handlers:
+            raise ValueError('Invalid argument "git %s" is not implemented or does not exists' % self.git_cmd)
+        return _handlers[self.git_cmd](self, package)
+
+    def __repr__(self):
+        return "<CommandPlan: %s %s>" % (self.git_cmd, self.flags)
+
+
+def parse_command_line(argv=None):
+    """
+    Parses and compiles the command line, exiting with the usage on invalid arguments
+    :param list(str) argv: Defaults to sys.argv
+    :return: AppArgsParser arguments and the compiled command
+    :rtype: (argparse.Namespace, CommandPlan)
+    """
+    parser = AppArgsParser.create()
+    args, git_args = parser.parse_known_args(argv)
+    if args.stream and args.format == 'json': parser.error('--stream cannot be combined with --format json')
+    if args.timeout is not None and args.timeout < 0: parser.error('--timeout cannot be negative')
+    try:
+        command = compile_command(args.git_cmd, git_args, args.stream)
+    except ValueError as e:
+        parser.error(e.message)
+    command.timeout = args.timeout
+    return args, command
+
+
+def compile_command(git_cmd, git_args, stream=False):
+    """
+    :param str git_cmd:
+    :param list(str) git_args: Command line arguments following git_cmd
+    :param bool stream:
+    :raise ValueError: When the arguments are not valid for git_cmd
+    :rtype: CommandPlan
+    """
+    if stream and git_cmd not in stream_commands:
+        raise ValueError('--stream is only available for %s' % ', '.join(stream_commands))
+    if git_cmd == 'daemon':
+        action = git_args[0] if git_args else 'start'
+        if action not in daemon_actions:
+            raise ValueError('Invalid daemon action "%s", use %s' % (action, ', '.join(daemon_actions)))
+        return CommandPlan(git_cmd, argument=action)
+    if git_cmd not in _parsers:
+        raise ValueError('Invalid argument "git %s" is not implemented or does not exists' % git_cmd)
+
+    args, unknown = _parsers[git_cmd].create().parse_known_args(git_args)
+    flags = dict((k, v) for k, v in vars(args).iteritems() if v)
+    if stream and 'numstat' in flags: raise ValueError('--stream cannot be combined with --numstat')
+    # --since already bounds a timeline, a default cap would silently cut it
+    if git_cmd == 'log' and '-n' not in flags and not ('timeline' in flags and 'since' in flags):
+        flags['-n'] = default_log_commits
+
+    if git_cmd == 'bash':
+        if not unknown: raise ValueError('Bash command missing')
+        return CommandPlan(git_cmd, flags, argument=unknown[0], stream=stream)
+    if git_cmd == 'commit':
+        message = ' '.join(unknown) if unknown else None
+        if message and message[0] in '\'"': message = message[1:]
+        if message and message[-1] in '\'"': message = message[:-1]
+        return CommandPlan(git_cmd, flags, argument=message)
+    if git_cmd == 'status':
+        return CommandPlan(git_cmd, flags)
+    if git_cmd == 'clone':
+        urls = list(unknown)
+        if 'from_file' in flags:
+            try:
+                with open(flags['from_file']) as stream: lines = [line.strip() for line in stream]
+            except IOError as e:
+                raise ValueError('Cannot read %s: %s' % (flags['from_file'], e.strerror))
+            urls += [line for line in lines if line and not line.startswith('#')]
+        return CommandPlan(git_cmd, flags, argument=urls)
+    if git_cmd == 'grep':
+        pattern = flags.pop('pattern', None) or (unknown.pop(0) if unknown else None)
+        if not pattern: raise ValueError('Grep pattern missing')
+        if '--cached' in flags and unknown: raise ValueError('--cached cannot be combined with revisions')
+        options = sorted(key for key in flags if key.startswith('-'))
+        return CommandPlan(git_cmd, flags, argument=options + ['-e', pattern] + unknown + ['--'])
+    if git_cmd == 'fetch':
+        if len(unknown) > 1: raise ValueError('Only one remote can be fetched, or every remote when none is given')
+        return CommandPlan(git_cmd, flags, remote=unknown[0] if unknown else None)
+
+    remote, branch = None, None
+    if len(unknown) >= 2: remote, branch = unknown[0], unknown[1]
+    elif len(unknown) >= 1:
+        if '/' in unknown[0]: remote, branch = unknown[0].split('/')[0], unknown[0].split('/')[1]
+        else: branch = unknown[0]
+    return CommandPlan(git_cmd, flags, remote, branch, stream=stream)
+
+
+def _run_checkout(plan, package):
+    """
+    :param CommandPlan plan:
+    :param Package package:
+    :rtype: str
+    """
+    if '-b' in plan.flags:
+        _from = ('%s/%s' % (plan.remote, plan.branch)) if plan.remote else plan.branch
+        return package.cmd_checkout(plan.flags, branch_name=plan.flags['-b'], from_branch=_from)
+    return package.cmd_checkout(plan.flags, branch_name=plan.branch)
+
+
+_parsers = {
+    'clone': GitCloneParser,
+    'log': GitLogParser,
+    'status': GitStatusParser,
+    'diff': GitDiffParser,
+    'grep': GitGrepParser,
+    'fetch': GitFetchParser,
+    'pull': GitPullParser,
+    'merge': GitMergeParser,
+    'push': GitPushParser,
+    'commit': GitCommitParser,
+    'bash': GitBashParser,
+    'checkout': GitCheckoutParser,
+    'clean': GitCleanParser,
+    'reset': GitResetParser,
+}
+
+_handlers = {
+    'clone': lambda plan, package: package.cmd_clone(plan.argument[package.name], plan.flags),
+    'log': lambda plan, package: package.cmd_log(plan.flags, plan.remote, plan.branch, plan.stream),
+    'status': lambda plan, package: package.cmd_status(plan.flags),
+    'diff': lambda plan, package: package.cmd_diff(plan.flags, plan.remote, plan.branch, plan.stream),
+    'fetch': lambda plan, package: package.cmd_fetch(plan.flags, plan.remote),
+    'pull': lambda plan, package: package.cmd_pull(plan.flags, plan.remote, plan.branch),
+    'merge': lambda plan, package: package.cmd_merge(plan.remote, plan.branch),
+    'push': lambda plan, package: package.cmd_push(plan.flags, plan.remote, plan.branch),
+    'commit': lambda plan, package: package.cmd_commit(plan.flags, plan.argument),
+    'bash': lambda plan, package: package.cmd_bash(plan.argument, stream=plan.stream),
+    'checkout': _run_checkout,
+    'clean': lambda plan, package: package.cmd_clean(plan.remote, plan.branch),
+    'reset': lambda plan, package: package.cmd_reset(plan.flags, plan.remote, plan.branch),
+}
@@ -0,0 +1,252 @@
+import json
+import socket
+import sys
+import threading
+import time
+import traceback
+from os import path, environ, makedirs, remove, sep
+from SocketServer import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+
+from helpers import Color, thread_map
+
+try:
+    import pyinotify
+except ImportError:
+    # Optional: without it the daemon polls the packages every "daemon.poll" seconds
+    pyinotify = None
+
+SOCKET_FILE = path.join('.mgit', 'daemon.sock')
+# Seconds changes are accumulated before refreshing the packages they touched
+DEBOUNCE = 0.2
+
+
+class WorkspaceDaemon(object):
+    """
+    Keeps an in-memory model of every package's branch, dirty state and ahead/behind counts
+    (against the last fetched upstream, the daemon never fetches) and serves it over
+    `<workspace>/.mgit/daemon.sock`. Packages are refreshed when inotify reports a change
+    in them, or periodically when pyinotify is not installed. Packages inotify cannot watch,
+    e.g. past fs.inotify.max_user_watches, are refreshed periodically and flagged as not watched,
+    so clients do not trust their dirty flag.
+    """
+    workspace = None
+    packages = None
+    model = None
+
+    def __init__(self, workspace, packages):
+        """
+        :param str workspace:
+        :param list(Package) packages:
+        """
+        self.workspace = workspace
+        # Keyed by real path, which is also what inotify reports and what clients look up
+        self.packages = dict((path.realpath(package.location), package) for package in packages)
+        self.model = dict()
+        self._stale = set(self.packages.keys())
+        self._unwatched = set()
+        self._changed = threading.Condition()
+        self._running = True
+
+    def serve(self):
+        socket_file = path.join(self.workspace, SOCKET_FILE)
+        if query_daemon(self.workspace, 'ping'): raise ValueError('A daemon is already running on this workspace')
+        if path.exists(socket_file): remove(socket_file)
+        if not path.isdir(path.dirname(socket_file)): makedirs(path.dirname(socket_file))
+
+        # Refreshing must not rewrite .git/index, which would be reported as a change again
+        environ['GIT_OPTIONAL_LOCKS'] = '0'
+        server = _Server(socket_file, _RequestHandler)
+        server.workspace_daemon = self
+        # Before the first refresh, so its entries know which packages are watched
+        notifier = self._watch()
+        refresher = threading.Thread(target=self._refresh_loop)
+        refresher.daemon = True
+        refresher.start()
+        print(Color.green('Watching %d packages (%s), listening on %s' % (
+            len(self.packages), 'inotify' if notifier else 'polling', socket_file)))
+        if self._unwatched:
+            print(Color.yellow('%d packages cannot be watched, see fs.inotify.max_user_watches. They are '
+                               'refreshed every %ss and their state is not served' % (
+                                   len(self._unwatched), environ.get('daemon.poll', 5))))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._running = False
+            if notifier: notifier.stop()
+            server.server_close()
+            if path.exists(socket_file): remove(socket_file)
+
+    def stop(self, server):
+        threading.Thread(target=server.shutdown).start()
+
+    def get_state(self):
+        """
+        :return: Model entry by real path of the package location, only for packages refreshed at least once
+        :rtype: dict
+        """
+        return dict(self.model)
+
+    def mark_stale(self, locations):
+        """
+        :param list(str) locations:
+        """
+        with self._changed:
+            self._stale.update(locations)
+            self._changed.notify()
+
+    def _refresh_loop(self):
+        workers = int(environ.get('discovery.workers', 16))
+        poll = float(environ.get('daemon.poll', 5))
+        while self._running:
+            polled = self._unwatched if pyinotify else self.packages.keys()
+            with self._changed:
+                if not self._stale: self._changed.wait(poll if polled else None)
+                if not self._stale: self._stale.update(polled)
+            time.sleep(DEBOUNCE)
+            with self._changed:
+                stale, self._stale = self._stale, set()
+            try:
+                thread_map(self._refresh, [self.packages[location] for location in stale], workers)
+            except Exception:
+                # The model would never be refreshed again, and be trusted by --only-local anyway
+                sys.stderr.write(Color.red(traceback.format_exc()) + '\n')
+
+    def _refresh(self, package):
+        """
+        :param Package package:
+        """
+        try:
+            branch, head = package.refs.get_head()
+            # Dirty flag and ahead/behind against the upstream from a single git call
+            status = package.get_status()
+            entry = {'branch': branch, 'head': head, 'remote_branch': package.get_cur_remote_branch(True),
+                     'dirty': status.is_dirty(), 'ahead': status.ahead, 'behind': status.behind,
+                     'watched': path.realpath(package.location) not in self._unwatched, 'updated_at': time.time()}
+        except Exception:
+            # E.g. the package was moved or deleted, clients fall back to their own index for it
+            entry = {'error': traceback.format_exc(), 'updated_at': time.time()}
+        self.model[path.realpath(package.location)] = entry
+
+    def _watch(self):
+        """
+        :return: None when pyinotify is not available
+        :rtype: pyinotify.ThreadedNotifier
+        """
+        if not pyinotify: return None
+        daemon = self
+
+        class Handler(pyinotify.ProcessEvent):
+            def process_default(self, event):
+                # Object and reflog writes always come along with a ref or index change
+                if '/.git/objects' in event.pathname or '/.git/logs' in event.pathname: return
+                location = daemon._get_location(event.pathname)
+                if location: daemon.mark_stale([location])
+
+        manager = pyinotify.WatchManager()
+        mask = pyinotify.IN_CREATE | pyinotify.IN_DELETE | pyinotify.IN_MODIFY | pyinotify.IN_MOVED_FROM \
+            | pyinotify.IN_MOVED_TO | pyinotify.IN_ATTRIB
+        notifier = pyinotify.ThreadedNotifier(manager, Handler())
+        notifier.daemon = True
+        notifier.start()
+        for location in self.packages:
+            watches = manager.add_watch(location, mask, rec=True, auto_add=True, quiet=True)
+            # Quiet, a directory which could not be watched only gets a negative descriptor
+            if not watches or any(wd < 0 for wd in watches.values()): self._unwatched.add(location)
+        return notifier
+
+    def _get_location(self, file_path):
+        """
+        :param str file_path:
+        :return: Location of the package containing file_path
+        :rtype: str|None
+        """
+        while file_path and file_path != sep:
+            if file_path in self.packages: return file_path
+            file_path = path.dirname(file_path)
+        return None
+
+
+class _Server(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+    workspace_daemon = None  # type: WorkspaceDaemon
+
+
+class _RequestHandler(StreamRequestHandler):
+    """
+    One JSON request per line: {"op": "ping" | "state" | "stop"}, answered with one JSON line
+    """
+    def handle(self):
+        request = json.loads(self.rfile.readline() or '{}')
+        op = request.get('op')
+        if op == 'state': response = {'packages': self.server.workspace_daemon.get_state()}
+        elif op == 'ping': response = {'pong': True}
+        elif op == 'stop':
+            response = {'stopping': True}
+            self.server.workspace_daemon.stop(self.server)
+        else: response = {'error': 'Unknown op "%s"' % op}
+        self.wfile.write(json.dumps(response) + '\n')
+
+
+def query_daemon(workspace, op, timeout=1.0):
+    """
+    :param str workspace:
+    :param str op: "ping", "state" or "stop"
+    :param float timeout: Seconds
+    :return: None when no daemon is running on the workspace
+    :rtype: dict|None
+    """
+    socket_file = path.join(workspace, SOCKET_FILE)
+    if not path.exists(socket_file): return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(socket_file)
+        client.sendall(json.dumps({'op': op}) + '\n')
+        response = client.makefile().readline()
+        return json.loads(response) if response else None
+    except (socket.error, ValueError):
+        return None
+    finally:
+        client.close()
+
+
+class DaemonState(object):
+    """
+    Same interface as StateIndex, answering from a running daemon's model. Packages the daemon
+    has not refreshed yet, or does not watch, are answered by the StateIndex.
+    """
+    packages = None
+    fallback = None
+
+    def __init__(self, packages, fallback):
+        """
+        :param dict packages: Daemon model by real path of the package location
+        :param StateIndex fallback:
+        """
+        self.packages = packages
+        self.fallback = fallback
+
+    def get_remote_branch(self, package):
+        entry = self._get_entry(package)
+        if not entry: return self.fallback.get_remote_branch(package)
+        return entry['remote_branch']
+
+    def has_local_changes(self, package):
+        entry = self._get_entry(package)
+        if not entry: return self.fallback.has_local_changes(package)
+        return entry['dirty']
+
+    def _get_entry(self, package):
+        """
+        :param Package package:
+        :return: None when the daemon state of the package cannot be trusted
+        :rtype: dict|None
+        """
+        entry = self.packages.get(path.realpath(package.location))
+        if not entry or 'error' in entry or not entry.get('watched', True): return None
+        return entry
+
+    def save(self):
+        self.fallback.save()
@@ -0,0 +1,104 @@
+import os
+import signal
+import subprocess
+import threading
+import time
+
+# Seconds given to the commands started once the deadline passed, e.g. `git stash pop` restoring
+# the changes stashed by a pull which was killed
+GRACE = 10
+
+# Deadline and process group of the package the current thread is running a command on
+_local = threading.local()
+# Process groups of the packages with a deadline running in this process
+_groups = set()
+
+
+def start(timeout, spent=0):
+    """
+    Starts the deadline of the package run by the current thread. With a timeout, the git
+    processes it starts join a process group of the package, killed with everything they spawned
+    once the deadline passes.
+    :param float timeout: Seconds the package has, None or 0 for no limit
+    :param float spent: Seconds already spent on the package, e.g. planning it
+    """
+    clear()
+    if not timeout: return
+    _local.deadline = time.time() + timeout - spent
+    # Idle group leader, it exits once its stdin is closed by `clear` or by the end of mgit
+    _local.leader = subprocess.Popen(['cat'], stdin=subprocess.PIPE, stdout=open(os.devnull, 'w'),
+                                     preexec_fn=os.setpgrp)
+    _groups.add(_local.leader.pid)
+    _local.timer = threading.Timer(max(_local.deadline - time.time(), 0), kill_group, [_local.leader.pid])
+    _local.timer.daemon = True
+    _local.timer.start()
+
+
+def clear():
+    _local.deadline = None
+    timer, leader = getattr(_local, 'timer', None), getattr(_local, 'leader', None)
+    _local.timer = _local.leader = None
+    if timer: timer.cancel()
+    if leader:
+        _groups.discard(leader.pid)
+        leader.stdin.close()
+        leader.wait()
+
+
+def remaining():
+    """
+    Seconds a command started now may run before it is killed
+    :return: None when there is no deadline
+    :rtype: float|None
+    """
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is None: return None
+    left = deadline - time.time()
+    return left if left > 0 else GRACE
+
+
+def is_expired():
+    """
+    :rtype: bool
+    """
+    deadline = getattr(_local, 'deadline', None)
+    return deadline is not None and time.time() >= deadline
+
+
+def get_group():
+    """
+    :return: Process group git processes of the current package join, None without deadline
+    :rtype: int|None
+    """
+    leader = getattr(_local, 'leader', None)
+    return leader.pid if leader else None
+
+
+def join_group(pgid):
+    """
+    Runs in the forked child before git is executed
+    :param int pgid:
+    """
+    try:
+        os.setpgid(0, pgid)
+    except OSError:
+        # The group was already killed, the command only gets the grace period then
+        pass
+
+
+def kill_group(pgid):
+    """
+    :param int pgid:
+    """
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except OSError:
+        # Already finished
+        pass
+
+
+def kill_groups():
+    """
+    Kills the git processes of every package with a deadline running in this process
+    """
+    for pgid in list(_groups): kill_group(pgid)
@@ -0,0 +1,75 @@
+from helpers import Color
+from runner import PASSED
+
+
+class DiffStat(object):
+    """
+    Files, insertions and deletions of a package diff, parsed from `git diff --numstat`.
+    Binary files count as changed files without lines.
+    """
+    status = PASSED
+    files = 0
+    insertions = 0
+    deletions = 0
+    binaries = 0
+
+    def __init__(self, files=0, insertions=0, deletions=0, binaries=0):
+        self.files = files
+        self.insertions = insertions
+        self.deletions = deletions
+        self.binaries = binaries
+
+    @staticmethod
+    def parse(numstat):
+        """
+        :param str numstat: `git diff --numstat` output, "<added>\t<deleted>\t<file>" per line
+        :rtype: DiffStat
+        """
+        stat = DiffStat()
+        for line in numstat.split('\n'):
+            if not line: continue
+            added, deleted = line.split('\t', 2)[:2]
+            stat.files += 1
+            if added == '-': stat.binaries += 1
+            else: stat.insertions, stat.deletions = stat.insertions + int(added), stat.deletions + int(deleted)
+        return stat
+
+    def to_dict(self):
+        """
+        :rtype: dict
+        """
+        return {'files': self.files, 'insertions': self.insertions, 'deletions': self.deletions,
+                'binaries': self.binaries}
+
+    def __str__(self):
+        if not self.files: return Color.yellow("There is not changes")
+        return '%d files changed, %s, %s' % (self.files, Color.green('%d insertions(+)' % self.insertions),
+                                             Color.red('%d deletions(-)' % self.deletions))
+
+
+def format_diff_stats(results):
+    """
+    Packages with changes sorted by number of changed lines, biggest diff first, and the workspace totals
+    :param list(PackageResult) results: Their details are the DiffStat ones, None when the diff failed
+    :rtype: str
+    """
+    width = max([len(result.name) for result in results] + [len('Package')])
+    lines = ['%s  %6s  %10s  %10s' % ('Package'.ljust(width), 'Files', 'Insertions', 'Deletions')]
+    totals, failed, unchanged = DiffStat(), [], 0
+    by_size = lambda r: (-(r.details['insertions'] + r.details['deletions']) if r.details else 0, r.name)
+    for result in sorted(results, key=by_size):
+        if not result.details:
+            failed.append(result.name)
+            continue
+        stat = result.details
+        if not stat['files']:
+            unchanged += 1
+            continue
+        for key in ['files', 'insertions', 'deletions', 'binaries']: setattr(totals, key, getattr(totals, key) + stat[key])
+        lines.append('%s  %6d  %s  %s' % (result.name.ljust(width), stat['files'],
+                                          Color.green('%10d' % stat['insertions']),
+                                          Color.red('%10d' % stat['deletions'])))
+    lines.append('%s  %6d  %10d  %10d' % ('Total'.ljust(width), totals.files, totals.insertions, totals.deletions))
+    if unchanged: lines.append(Color.yellow('%d packages without changes' % unchanged))
+    if failed: lines.append(Color.red('Failed: %s' % ', '.join(failed)))
+    return '\n'.join(lines)
@@ -0,0 +1,110 @@
+import fnmatch
+from os import path, listdir
+
+from helpers import thread_map
+
+try:
+    from os import scandir
+except ImportError:
+    # Python 2: optional backport, plain listdir + stat otherwise
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+IGNORE_FILE = '.mgitignore'
+# mgit's own workspace data
+ALWAYS_IGNORED = ['.mgit']
+
+
+def discover_repositories(root, max_depth=1, ignore_patterns=None, workers=16):
+    """
+    Finds git repositories below root, up to max_depth folders deep. The search does not
+    descend into repositories, and every top level folder is walked on its own thread.
+    :param str root: Workspace folder
+    :param int max_depth: 1 only looks at the direct children of root
+    :param list(str) ignore_patterns: Glob patterns matched against the folder name and
+        its path relative to root, see `get_ignore_patterns`
+    :param int workers: Max number of subtrees walked concurrently
+    :return: Repository folders, sorted
+    :rtype: list(str)
+    """
+    ignore_patterns = ALWAYS_IGNORED + (ignore_patterns or [])
+    children = _list_folders(root, '', ignore_patterns)
+    found = thread_map(lambda child: _walk(child[0], child[1], 1, max_depth, ignore_patterns), children, workers)
+    return sorted(folder for folders in found for folder in folders)
+
+
+def get_ignore_patterns(root):
+    """
+    Patterns of `<root>/.mgitignore`, one glob per line, `#` starts a comment
+    :param str root:
+    :rtype: list(str)
+    """
+    ignore_file = path.join(root, IGNORE_FILE)
+    if not path.isfile(ignore_file): return []
+    with open(ignore_file) as stream:
+        lines = [line.strip() for line in stream]
+    return [line.rstrip('/') for line in lines if line and not line.startswith('#')]
+
+
+def _walk(folder, relative, depth, max_depth, ignore_patterns):
+    """
+    :param str folder: Absolute folder
+    :param str relative: Folder relative to the workspace
+    :param int depth: Depth of folder, 1 for the workspace children
+    :param int max_depth:
+    :param list(str) ignore_patterns:
+    :rtype: list(str)
+    """
+    entries = _scan(folder)
+    if entries is None: return []
+    if '.git' in [name for name, is_dir in entries]: return [folder]
+    if depth >= max_depth: return []
+    found = []
+    for child, child_relative in _list_folders(folder, relative, ignore_patterns, entries):
+        found += _walk(child, child_relative, depth + 1, max_depth, ignore_patterns)
+    return found
+
+
+def _list_folders(folder, relative, ignore_patterns, entries=None):
+    """
+    :param str folder:
+    :param str relative:
+    :param list(str) ignore_patterns:
+    :param list((str, bool)) entries: Already scanned entries of folder
+    :return: Absolute and workspace relative path of the sub-folders not ignored
+    :rtype: list((str, str))
+    """
+    entries = _scan(folder) if entries is None else entries
+    folders = []
+    for name, is_dir in entries or []:
+        child_relative = path.join(relative, name) if relative else name
+        if not is_dir or _is_ignored(name, child_relative, ignore_patterns): continue
+        folders.append((path.join(folder, name), child_relative))
+    return folders
+
+
+def _scan(folder):
+    """
+    Entry names and whether they are folders, using the entry type reported by the directory
+    listing when available instead of a stat per entry
+    :param str folder:
+    :return: None if the folder cannot be read
+    :rtype: list((str, bool))|None
+    """
+    try:
+        if scandir: return [(entry.name, entry.is_dir()) for entry in scandir(folder)]
+        return [(name, path.isdir(path.join(folder, name))) for name in listdir(folder)]
+    except OSError:
+        return None
+
+
+def _is_ignored(name, relative, ignore_patterns):
+    """
+    :param str name:
+    :param str relative:
+    :param list(str) ignore_patterns:
+    :rtype: bool
+    """
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative, pattern) for pattern in ignore_patterns)
@@ -0,0 +1,50 @@
+import time
+from os import path, makedirs, utime, environ
+
+
+class FetchCache(object):
+    """
+    Remembers when every (package, remote) pair was last fetched through marker files
+    stored in `<workspace>/.mgit/fetch/<package>/<remote>`. A remote is considered fresh
+    when it was already fetched during the current run or within the last `fetch.ttl`
+    seconds, so it does not need to hit the network again.
+    Markers are plain files, so the cache works the same from threads, forked workers
+    and consecutive mgit invocations.
+    """
+    folder = None
+    ttl = 0
+    run_started = None
+
+    def __init__(self, workspace, ttl=None):
+        """
+        :param str workspace: Workspace folder
+        :param int ttl: Seconds a fetch is trusted across runs (fetch.ttl)
+        """
+        self.folder = path.join(workspace, '.mgit', 'fetch')
+        self.ttl = int(environ.get('fetch.ttl', 0)) if ttl is None else ttl
+        self.run_started = time.time()
+
+    def is_fresh(self, package_name, remote):
+        """
+        :param str package_name:
+        :param str remote:
+        :rtype: bool
+        """
+        marker = path.join(self.folder, package_name, remote)
+        if not path.isfile(marker): return False
+        fetched_at = path.getmtime(marker)
+        return fetched_at >= self.run_started or time.time() - fetched_at < self.ttl
+
+    def touch(self, package_name, remote):
+        """
+        :param str package_name:
+        :param str remote:
+        """
+        marker = path.join(self.folder, package_name, remote)
+        try:
+            if not path.isdir(path.dirname(marker)): makedirs(path.dirname(marker))
+        except OSError:
+            # Another worker created it meanwhile
+            if not path.isdir(path.dirname(marker)): raise
+        with open(marker, 'a'):
+            utime(marker, None)
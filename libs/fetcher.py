@@ -0,0 +1,306 @@
+import errno
+import fcntl
+import re
+import shutil
+import tempfile
+import time
+import os
+from os import path, makedirs, environ
+from urlparse import urlparse
+
+from helpers import Color
+from runner import run_process, is_cancelled, CommandResult, PASSED, FAILED, TIMEOUT, CANCELLED
+import deadline
+
+# Shared by every mgit process of the user, so concurrent runs respect the same limits. Private, other
+# users could otherwise hold every slot of a host
+LOCKS_FOLDER = path.join(tempfile.gettempdir(), 'mgit-%d' % os.getuid())
+LOCAL_HOST = 'local'
+# Output of failures worth another attempt, anything else (unknown remote, denied access...) fails at once
+TRANSIENT_ERRORS = ['Could not resolve host', 'Connection refused', 'Connection reset', 'Connection timed out',
+                    'Operation timed out', 'early EOF', 'remote end hung up unexpectedly', 'RPC failed',
+                    'The requested URL returned error: 5', 'Too many', 'rate limit', 'index-pack failed',
+                    'unable to access']
+_RECEIVED_RE = re.compile(r'Receiving objects: .*?, ([\d.]+) (bytes|KiB|MiB|GiB)')
+_UNITS = {'bytes': 1, 'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3}
+
+
+class RemoteFetch(object):
+    """
+    Outcome of fetching one remote of a package
+    """
+    remote = None
+    host = None
+    status = None
+    attempts = 0
+    n_bytes = 0
+    duration = 0
+    error = None
+
+    def __init__(self, remote, host, status, attempts, n_bytes, duration, error=None):
+        self.remote = remote
+        self.host = host
+        self.status = status
+        self.attempts = attempts
+        self.n_bytes = n_bytes
+        self.duration = duration
+        self.error = error
+
+    def to_dict(self):
+        """
+        :rtype: dict
+        """
+        return {'remote': self.remote, 'host': self.host, 'status': self.status, 'attempts': self.attempts,
+                'n_bytes': self.n_bytes, 'duration': round(self.duration, 3), 'error': self.error}
+
+    def __str__(self):
+        retries = ' after %d attempts' % self.attempts if self.attempts > 1 else ''
+        if self.status != PASSED:
+            return Color.red('%s (%s): failed%s\n%s' % (self.remote, self.host, retries, (self.error or '').strip()))
+        return Color.green('%s (%s): %s in %.1fs%s' % (self.remote, self.host, format_bytes(self.n_bytes),
+                                                       self.duration, retries))
+
+
+class FetchResult(object):
+    """
+    Every remote fetched on a package, a clone is a single fetch of origin
+    """
+    fetches = None
+
+    def __init__(self, fetches):
+        """
+        :param list(RemoteFetch) fetches:
+        """
+        self.fetches = fetches
+
+    @property
+    def status(self):
+        for status in [FAILED, TIMEOUT, CANCELLED]:
+            if any(fetch.status == status for fetch in self.fetches): return status
+        return PASSED
+
+    @property
+    def n_bytes(self):
+        return sum(fetch.n_bytes for fetch in self.fetches)
+
+    @property
+    def duration(self):
+        return sum(fetch.duration for fetch in self.fetches)
+
+    def to_dict(self):
+        """
+        :rtype: dict
+        """
+        return {'n_bytes': self.n_bytes, 'duration': round(self.duration, 3),
+                'remotes': [fetch.to_dict() for fetch in self.fetches]}
+
+    def __str__(self):
+        if not self.fetches: return Color.yellow('No remotes')
+        return '\n'.join(str(fetch) for fetch in self.fetches)
+
+
+def fetch_remote(package, remote, flags=None):
+    """
+    Fetches a remote of the package, marking it as fetched in the package fetch cache
+    :param Package package:
+    :param str remote:
+    :param dict flags: Parsed `mgit fetch` flags (prune)
+    :rtype: RemoteFetch
+    """
+    flags = flags or dict()
+    host = get_host(package.refs.get_remote_url(remote))
+    # Received packs are kept as they are (git gc consolidates them later) instead of being exploded
+    # into loose objects, which is the only case git reports the size it received
+    args = ['git', '-c', 'fetch.unpackLimit=1', 'fetch', '--progress'] \
+        + (['--prune'] if 'prune' in flags else []) + [remote]
+
+    started = time.time()
+    result, attempts = run_transfer(args, package.location, host)
+    if result.status != PASSED:
+        return RemoteFetch(remote, host, result.status, attempts, 0, time.time() - started, result.output)
+    if package.fetch_cache: package.fetch_cache.touch(package.name, remote)
+    return RemoteFetch(remote, host, PASSED, attempts, get_received_bytes(result.output), time.time() - started)
+
+
+def clone_repository(url, location, flags=None):
+    """
+    :param str url: Repository url or local path
+    :param str location: Folder the repository is cloned into, it must not exist
+    :param dict flags: Parsed `mgit clone` flags (reference, shared, filter, branch)
+    :rtype: FetchResult
+    """
+    flags = flags or dict()
+    args = ['git', 'clone', '--progress']
+    if 'reference' in flags: args += ['--reference-if-able', flags['reference']]
+    if 'shared' in flags: args += ['--shared']
+    if 'filter' in flags: args += ['--filter', flags['filter']]
+    if 'branch' in flags: args += ['--branch', flags['branch']]
+    host = get_host(url)
+    if not path.isdir(path.dirname(location)): makedirs(path.dirname(location))
+
+    started = time.time()
+    result, attempts = run_transfer(args + [url, location], path.dirname(location), host)
+    # A killed git clone cannot remove what it cloned so far, the next clone would skip the package
+    if result.status in [TIMEOUT, CANCELLED] and path.isdir(location): shutil.rmtree(location)
+    n_bytes = get_received_bytes(result.output) if result.status == PASSED else 0
+    error = result.output if result.status != PASSED else None
+    return FetchResult([RemoteFetch('origin', host, result.status, attempts, n_bytes, time.time() - started, error)])
+
+
+def run_transfer(args, cwd, host, retries=None, backoff=None, max_per_host=None):
+    """
+    Runs a git command talking to host once one of its connection slots is free, retrying
+    transient failures with exponential backoff
+    :param list(str) args:
+    :param str cwd:
+    :param str host: See `get_host`
+    :param int retries: Attempts after the first one (fetch.retries)
+    :param float backoff: Seconds before the first retry, doubled on every retry (fetch.backoff)
+    :param int max_per_host: Simultaneous connections per host (fetch.host_connections)
+    :return: Result of the last attempt and the number of attempts
+    :rtype: (CommandResult, int)
+    """
+    retries = int(environ.get('fetch.retries', 3)) if retries is None else retries
+    backoff = float(environ.get('fetch.backoff', 1)) if backoff is None else backoff
+    max_per_host = max_per_host or int(environ.get('fetch.host_connections', 4))
+    attempts, started = 0, time.time()
+    while True:
+        attempts += 1
+        with HostSlot(host, max_per_host) as slot:
+            if not slot.granted:
+                status = CANCELLED if is_cancelled() else TIMEOUT
+                return CommandResult(status, None, time.time() - started,
+                                     'Gave up waiting for a connection slot to %s' % host), attempts
+            result = run_process(args, cwd)
+        if result.status == PASSED or attempts > retries or not is_transient(result.output) \
+                or deadline.is_expired() or is_cancelled():
+            return result, attempts
+        time.sleep(backoff * 2 ** (attempts - 1))
+
+
+class HostSlot(object):
+    """
+    Holds one of the `limit` connection slots of a host while fetching. Slots are flock'ed
+    files, so the limit applies across threads, forked workers and other mgit processes of the user.
+    Waiting stops once the package is cancelled or its deadline passed, `granted` is False then.
+    """
+    host = None
+    limit = None
+    poll = 0.05
+    granted = False
+
+    def __init__(self, host, limit):
+        """
+        :param str host:
+        :param int limit:
+        """
+        self.host = host
+        self.limit = limit
+        self._file = None
+
+    def __enter__(self):
+        folder = get_locks_folder()
+        name = re.sub(r'[^\w.-]', '_', self.host)
+        while True:
+            for slot in range(self.limit):
+                lock_file = open(path.join(folder, '%s.%d' % (name, slot)), 'a')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError:
+                    lock_file.close()
+                    continue
+                self._file, self.granted = lock_file, True
+                return self
+            if deadline.is_expired() or is_cancelled(): return self
+            time.sleep(self.poll)
+
+    def __exit__(self, *args):
+        # Closing the file releases the lock
+        if self._file: self._file.close()
+        self._file = None
+
+
+def get_locks_folder():
+    """
+    Creates the folder of the slot locks, readable by the current user only
+    :rtype: str
+    """
+    try:
+        makedirs(LOCKS_FOLDER, 0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST: raise
+    # Another user may have created it first at the same predictable location
+    if os.stat(LOCKS_FOLDER).st_uid != os.getuid():
+        raise ValueError('Fetch locks folder %s is owned by another user' % LOCKS_FOLDER)
+    return LOCKS_FOLDER
+
+
+def get_host(url):
+    """
+    :param str url: Remote url: scheme://[user@]host[:port]/path, scp-like [user@]host:path or a local path
+    :rtype: str
+    """
+    if not url: return LOCAL_HOST
+    if '://' in url:
+        parsed = urlparse(url)
+        return parsed.hostname or LOCAL_HOST
+    # scp-like syntax, a colon before any slash
+    if ':' in url and '/' not in url.split(':')[0]: return url.split(':')[0].split('@')[-1]
+    return LOCAL_HOST
+
+
+def is_transient(output):
+    """
+    :param str output:
+    :rtype: bool
+    """
+    return any(error in (output or '') for error in TRANSIENT_ERRORS)
+
+
+def get_received_bytes(output):
+    """
+    Size of the last "Receiving objects" progress line, 0 when nothing was received
+    :param str output: Output of `git fetch --progress`
+    :rtype: int
+    """
+    sizes = _RECEIVED_RE.findall((output or '').replace('\r', '\n'))
+    if not sizes: return 0
+    value, unit = sizes[-1]
+    return int(float(value) * _UNITS[unit])
+
+
+def format_bytes(n_bytes):
+    """
+    :param int n_bytes:
+    :rtype: str
+    """
+    for unit in ['bytes', 'KiB', 'MiB']:
+        if n_bytes < 1024: return ('%d %s' if unit == 'bytes' else '%.1f %s') % (n_bytes, unit)
+        n_bytes /= 1024.0
+    return '%.1f GiB' % n_bytes
+
+
+def format_fetch_results(results, done='fetched'):
+    """
+    Bytes and time table of the packages fetched
+    :param list(PackageResult) results: Their details are the FetchResult ones, None when the
+        package failed before fetching
+    :param str done: How successful packages are counted, e.g. "cloned"
+    :rtype: str
+    """
+    width = max([len(result.name) for result in results] + [len('Package')])
+    lines = ['%s  %-9s  %7s  %10s  %8s' % ('Package'.ljust(width), 'Status', 'Remotes', 'Received', 'Time')]
+    total_bytes, failed = 0, 0
+    for result in sorted(results, key=lambda r: r.name):
+        status = result.status
+        if result.details:
+            n_bytes = result.details['n_bytes']
+            row = (len(result.details['remotes']), format_bytes(n_bytes), '%7.1fs' % result.details['duration'])
+        else:
+            n_bytes, row = 0, ('-', '-', '-')
+        total_bytes += n_bytes
+        failed += status != PASSED
+        color = Color.green if status == PASSED else Color.yellow if status == CANCELLED else Color.red
+        lines.append('%s  %s  %7s  %10s  %8s' % ((result.name.ljust(width), color(status.ljust(9))) + row))
+    lines.append('%d %s, %d failed, %s received' % (len(results) - failed, done, failed, format_bytes(total_bytes)))
+    return '\n'.join(lines)
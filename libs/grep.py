@@ -0,0 +1,134 @@
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from helpers import thread_map
+from profiler import record
+from runner import get_stream_prefix
+
+
+class WorkspaceGrep(object):
+    """
+    Runs `git grep` on several packages at once and writes every match as soon as it is read,
+    prefixed by its package. Once max_matches are written, the running greps are killed and the
+    packages not started yet are skipped. Packages without any match because of that are listed
+    in `cancelled`, the ones whose remaining matches were dropped in `truncated`. A grep still running once its package timeout passed is killed, its package is
+    listed in `timed_out`.
+    """
+    args = None
+    max_matches = 0
+    n_matches = 0
+    matches = None
+    errors = None
+    cancelled = None
+    truncated = None
+    timed_out = None
+
+    def __init__(self, args, max_matches=0, out=None, collect=False, get_timeout=None):
+        """
+        :param list(str) args: git grep arguments: flags, pattern and revisions
+        :param int max_matches: Matches of the whole workspace, 0 for no limit
+        :param file out: Defaults to sys.stdout
+        :param bool collect: Keep the matches in `matches` instead of writing them
+        :param callable get_timeout: Seconds a package has to grep, 0 for no limit
+        """
+        self.args = args
+        self.max_matches = max_matches
+        self.out = out or sys.stdout
+        self.collect = collect
+        self.matches = []
+        self.errors = dict()
+        self.cancelled = []
+        self.truncated = []
+        self.timed_out = []
+        self.get_timeout = get_timeout or (lambda package: 0)
+        # Matches by package name
+        self.counts = dict()
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._running = dict()
+
+    def run(self, packages, workers):
+        """
+        :param list(Package) packages:
+        :param int workers: Max greps running at once
+        """
+        thread_map(self._grep, packages, workers)
+
+    def _grep(self, package):
+        """
+        :param Package package:
+        """
+        name = package.get_name()
+        with self._lock:
+            if self._done.is_set():
+                self.cancelled.append(name)
+                return
+            started, command = time.time(), ['git', 'grep', '--line-number'] + self.args
+            # Buffered, python 2 reads unbuffered pipes one byte per syscall. stderr goes to a file, a
+            # full stderr pipe would block git while stdout is read
+            errors = tempfile.TemporaryFile()
+            process = self._running[name] = subprocess.Popen(command, cwd=package.location, bufsize=-1,
+                                                             stdout=subprocess.PIPE, stderr=errors)
+        timer, timeout = None, self.get_timeout(package)
+        if timeout:
+            timer = threading.Timer(timeout, self._timeout, [name, process])
+            timer.daemon = True
+            timer.start()
+        prefix, count, dropped = get_stream_prefix(name), 0, False
+        for line in iter(process.stdout.readline, b''):
+            with self._lock:
+                if self._done.is_set():
+                    dropped = True
+                    break
+                count += 1
+                self.n_matches += 1
+                if self.collect: self.matches.append((name, line.rstrip('\n')))
+                else: self.out.write(prefix + line)
+                if self.max_matches and self.n_matches >= self.max_matches: self._stop()
+        if not self.collect: self.out.flush()
+
+        if timer: timer.cancel()
+        with self._lock: del self._running[name]
+        # Still running when the limit was reached while reading its output
+        if process.poll() is None: process.kill()
+        process.stdout.close()
+        exit_code = process.wait()
+        errors.seek(0)
+        error = errors.read()
+        errors.close()
+        stopped = exit_code < 0
+        record(package.location, command, started, 'stopped' if stopped else exit_code)
+        with self._lock:
+            self.counts[name] = count
+            if name in self.timed_out: pass
+            # Cut short by the match limit or Ctrl-C, even if git itself was already done
+            elif stopped or dropped: (self.truncated if count else self.cancelled).append(name)
+            # git grep exits with 1 when nothing matched
+            elif exit_code > 1: self.errors[name] = error.strip()
+
+    def cancel(self):
+        """
+        Kills the running greps and skips the packages not started yet, e.g. on Ctrl-C
+        """
+        with self._lock: self._stop()
+
+    def _timeout(self, name, process):
+        """
+        :param str name:
+        :param subprocess.Popen process:
+        """
+        with self._lock:
+            if process.poll() is not None: return
+            self.timed_out.append(name)
+            process.kill()
+
+    def _stop(self):
+        """
+        Called with the lock held, once the match limit is reached
+        """
+        self._done.set()
+        for process in self._running.values():
+            if process.poll() is None: process.kill()
@@ -1,6 +1,8 @@
 import multiprocessing
+import os
+import signal
 import traceback
-from multiprocessing.pool import Pool
+from multiprocessing.pool import Pool, ThreadPool
 
 
 class Color():
@@ -54,3 +56,59 @@ class LogExceptions(object):
 class LoggingPool(Pool):
     def apply_async(self, func, args=(), kwds={}, callback=None):
         return Pool.apply_async(self, LogExceptions(func), args, kwds, callback)
+
+class LoggingThreadPool(ThreadPool):
+    def apply_async(self, func, args=(), kwds={}, callback=None):
+        return ThreadPool.apply_async(self, LogExceptions(func), args, kwds, callback)
+
+def create_pool(executor, processes, initializer=None):
+    """
+    Commands mostly wait on git subprocesses and network, so the thread executor can run far
+    more packages at once than there are cores without forking a python interpreter for each.
+    :param str executor: "process", "thread" or "serial"
+    :param int processes: Max number of packages running at once
+    :param callable initializer: Called by every process worker once it started
+    :rtype: Pool|None
+    """
+    if executor == 'thread': return LoggingThreadPool(processes=processes)
+    if executor == 'process': return LoggingPool(processes=processes, initializer=initializer)
+    if executor == 'serial': return None
+    raise ValueError('Invalid executor "%s"' % executor)
+
+
+def interrupt_workers(pool):
+    """
+    Forwards Ctrl-C to the process workers of pool, they only get it from the terminal otherwise
+    :param Pool pool:
+    """
+    for worker in pool._pool:
+        # Thread workers have no pid, they share the signal handling of this process
+        if not getattr(worker, 'pid', None): continue
+        try:
+            os.kill(worker.pid, signal.SIGINT)
+        except OSError:
+            pass
+
+
+def thread_map(func, items, workers):
+    """
+    Maps func over items on a bounded thread pool, meant for I/O bound work such as
+    spawning git processes. Results keep the order of items.
+    :param callable func:
+    :param list items:
+    :param int workers: Max number of concurrent threads
+    :rtype: list
+    """
+    if not items: return []
+    pool = ThreadPool(processes=max(1, min(len(items), workers)))
+    result = pool.map_async(func, items)
+    pool.close()
+    try:
+        # Waiting without a timeout would not be interrupted by Ctrl-C on python 2
+        while not result.ready(): result.wait(0.5)
+    except KeyboardInterrupt:
+        # Threads blocked on a process cannot be stopped, they are left behind
+        pool.terminate()
+        raise
+    pool.join()
+    return result.get()
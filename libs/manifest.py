@@ -0,0 +1,92 @@
+import yaml
+from os import path
+
+
+class Manifest(object):
+    """
+    Optional declarative list of the workspace packages (config/manifest.yml). When present,
+    packages are taken from it instead of scanning the workspace folder.
+
+    packages:
+      repository-1:                # Package name
+        path: repository-1         # Relative to the workspace, defaults to the name
+        url: git@host:repository-1 # Where `mgit clone` clones it from
+        remote: origin             # Default remote, otherwise its first remote
+        branch: master             # Production branch, used by --no-prod instead of "prod_branch"
+        timeout: 300               # Seconds it has to complete a command, instead of the "timeout" config
+    groups:
+      backend: [repository-1, repository-2]
+    """
+    packages = None
+    groups = None
+
+    def __init__(self, packages, groups):
+        """
+        :param dict packages: Package settings by name
+        :param dict groups: Package names by group
+        """
+        self.packages = packages
+        self.groups = groups
+
+    @staticmethod
+    def load(file_path):
+        """
+        :param str file_path:
+        :return: None when the file does not exist
+        :rtype: Manifest|None
+        :raise ValueError: When the manifest is not valid
+        """
+        if not path.isfile(file_path): return None
+        with open(file_path) as stream:
+            try:
+                data = yaml.safe_load(stream) or dict()
+            except yaml.YAMLError as e:
+                raise ValueError(str(e))
+        packages = dict((str(name), settings or dict()) for name, settings in (data.get('packages') or dict()).items())
+        groups = dict((str(name), [str(package) for package in members or []])
+                      for name, members in (data.get('groups') or dict()).items())
+        for group, members in groups.items():
+            unknown = [member for member in members if member not in packages]
+            if unknown: raise ValueError('Group "%s" has unknown packages: %s' % (group, ', '.join(unknown)))
+        for name, settings in packages.items():
+            try:
+                if settings.get('timeout') is not None: float(settings['timeout'])
+            except (TypeError, ValueError):
+                raise ValueError('Package "%s" has an invalid timeout: %s' % (name, settings['timeout']))
+        return Manifest(packages, groups)
+
+    def get_locations(self, workspace):
+        """
+        :param str workspace:
+        :return: Folder, name, default remote and branch of every package, sorted by name
+        :rtype: list((str, str, str, str))
+        """
+        return [(path.join(workspace, settings.get('path', name)), name, settings.get('remote'), settings.get('branch'))
+                for name, settings in sorted(self.packages.items())]
+
+    def get_urls(self, workspace):
+        """
+        :param str workspace:
+        :return: Folder, name and url of every package with an url, sorted by name
+        :rtype: list((str, str, str))
+        """
+        return [(path.join(workspace, settings.get('path', name)), name, settings['url'])
+                for name, settings in sorted(self.packages.items()) if settings.get('url')]
+
+    def get_timeout(self, name):
+        """
+        :param str name: Package name
+        :return: None when the package does not set it
+        :rtype: float|None
+        """
+        timeout = self.packages.get(name, dict()).get('timeout')
+        return None if timeout is None else float(timeout)
+
+    def get_group_packages(self, groups):
+        """
+        :param list(str) groups:
+        :rtype: list(str)
+        """
+        unknown = [group for group in groups if group not in self.groups]
+        if unknown: raise ValueError('Unknown groups: %s' % ', '.join(unknown))
+        return [name for group in groups for name in self.groups[group]]
@@ -1,71 +1,205 @@
 import subprocess
+from multiprocessing.util import Finalize, ForkAwareThreadLock
 
 from git import Repo, GitCommandError
 from git.cmd import Git
 from helpers import Color
-from os import path
+from fetch_cache import FetchCache
+from runner import run_process, get_stream_prefix, PASSED, TIMEOUT, CANCELLED
+from fetcher import fetch_remote, clone_repository, FetchResult
+from diffstat import DiffStat
+from status import WorkingTreeStatus
+from profiler import TracingRepo
+from refs import RefReader
+from os import path, getpid, environ
+
+# Repositories opened by the current process, keyed by location
+_repos = dict()
+_repos_pid = None
+# Guards both, a pool worker forked while another thread held it gets a new one
+_repos_lock = ForkAwareThreadLock()
+# (location, remote) pairs already fetched by the current process
+_fetched = set()
+# RefReader by location, they only hold paths so they are safe to share with forked workers
+_ref_readers = dict()
+# Whether git was built with its file system monitor daemon, None until checked
+_fsmonitor_supported = None
+
+
+def open_repo(location):
+    """
+    Repo objects are never shipped between processes. A forked worker must not reuse
+    the parent's instances (and their persistent git processes), so the cache is reset
+    whenever the pid changes. Threads opening the same location share a single Repo.
+    :param str location:
+    :rtype: Repo
+    """
+    global _repos, _repos_pid
+    _repos_lock.acquire()
+    try:
+        if _repos_pid != getpid():
+            _repos, _repos_pid = dict(), getpid()
+            # Pool workers run multiprocessing finalizers on exit, the main process does it at exit too
+            Finalize(None, close_repos, exitpriority=10)
+        repo = _repos.get(location)
+        if repo is None:
+            repo = _repos[location] = TracingRepo(location)
+        return repo
+    finally:
+        _repos_lock.release()
+
+
+def is_fsmonitor_supported():
+    """
+    :rtype: bool
+    """
+    global _fsmonitor_supported
+    if _fsmonitor_supported is None:
+        _fsmonitor_supported = 'fsmonitor--daemon' in Git().version(build_options=True)
+    return _fsmonitor_supported
+
+
+def close_repos():
+    """
+    Stops the persistent git processes (cat-file --batch-check) of every repository opened by
+    the current process
+    """
+    _repos_lock.acquire()
+    try:
+        for repo in _repos.values(): repo.close()
+        _repos.clear()
+    finally:
+        _repos_lock.release()
 
 
 class Package(object):
+    """
+    Path-only handle: it pickles as name and location, and the repository is opened
+    lazily in the process actually running git commands.
+    """
     location = None
     name = None
-    repo = None
-    git = None  # type: Git
-
-    def __init__(self, location):
-        self.name = path.split(location)[-1]
+    fetch_cache = None  # type: FetchCache
+    default_remote = None
+    default_branch = None
+    timeout = None
+    # Seconds already spent on the package by planning, deducted from its timeout
+    time_spent = 0
+
+    def __init__(self, location, fetch_cache=None, name=None, default_remote=None, default_branch=None,
+                 timeout=None):
+        self.name = name or path.split(location)[-1]
         self.location = location
-        self.repo = Repo(location)
-        self.git = self.repo.git
+        self.fetch_cache = fetch_cache
+        self.default_remote = default_remote
+        self.default_branch = default_branch
+        self.timeout = timeout
+
+    @property
+    def repo(self):
+        """
+        :rtype: Repo
+        """
+        return open_repo(self.location)
+
+    @property
+    def git(self):
+        """
+        :rtype: Git
+        """
+        return self.repo.git
+
+    @property
+    def refs(self):
+        """
+        :rtype: RefReader
+        """
+        refs = _ref_readers.get(self.location)
+        if refs is None:
+            refs = _ref_readers[self.location] = RefReader(self.location)
+        return refs
 
     def get_cur_remote_branch(self, joint = False):
-        if self.repo.head.is_detached: return "Branch detached"
-        try:
-            branch = self.repo.head.reference.name
-            remote = next(iter([remote.name for remote in self.repo.remotes if self.repo.head.repo == remote.repo]))
-        except TypeError:
-            return "Branch detached"
-        else:
-            if joint: return '/'.join([remote, branch])
-            return remote, branch
+        branch = self.refs.get_head_branch()
+        if branch is None: return "Branch detached"
+        remotes = self.refs.get_remotes()
+        if self.default_remote in remotes: remote = self.default_remote
+        else: remote = remotes[0] if remotes else None
+        if joint: return '/'.join([remote, branch]) if remote else branch
+        return remote, branch
 
     def get_available_remotes(self):
-        return [remote.name for remote in self.repo.remotes]
+        return self.refs.get_remotes()
 
     def get_name(self):
         return self.name
 
+    def get_prod_branch(self):
+        """
+        :return: "remote/branch" considered production, from the manifest or "prod_branch" config
+        :rtype: str
+        """
+        if not self.default_branch: return environ['prod_branch']
+        return '/'.join([self.default_remote or environ.get('remote.default', 'origin'), self.default_branch])
+
     def get_available_local_branches(self):
-        return [branch.name for branch in self.repo.branches]
+        return self.refs.get_branches()
 
     def get_available_remote_branches(self, remote_name):
-        available_branches = []
-        for remote in self.repo.remotes:
-            if remote.name != remote_name: continue
-            available_branches = [ref.remote_head for ref in remote.refs]
-        return available_branches
+        return self.refs.get_remote_branches(remote_name)
 
-    def cmd_log(self, flags, remote, branch):
+    def cmd_log(self, flags, remote, branch, stream=False):
         cur_remote, cur_branch = self.get_cur_remote_branch()
         branch = branch or cur_branch
         self._assert_remote_branch(remote, branch)
         list_args = self._get_args_list(flags)
         if remote: list_args += ['%s/%s' % (remote, branch)]
         else: list_args += [branch]
+        if stream: return self._stream_git(['log'] + list_args)
         output = self.git.log(list_args)
         if not output: output = Color.yellow("There is not changes")
         return output
 
     def cmd_status(self, flags):
-        return self.git.status(**flags)
-
-    def cmd_diff(self, flags, remote, branch):
+        flags = dict(flags)
+        notes = self._enable_status_caches(flags.pop('untracked_cache', False), flags.pop('fsmonitor', False))
+        if flags.pop('short', False):
+            status = self.get_status()
+            status.notes += notes
+            return status
+        return '\n'.join([self.git.status(**flags)] + notes)
+
+    def get_status(self, branch=True):
+        """
+        :param bool branch: Also read branch, upstream and ahead/behind
+        :rtype: WorkingTreeStatus
+        """
+        return WorkingTreeStatus.parse(self.git.status('--porcelain=v2', *(['--branch'] if branch else [])))
+
+    def _enable_status_caches(self, untracked_cache, fsmonitor):
+        """
+        Turns on the caches speeding up `git status` on large working trees, for good
+        :param bool untracked_cache: Remember untracked files per folder in the index
+        :param bool fsmonitor: Let git's file system monitor daemon report the changed files
+        :return: Notes about what could not be enabled
+        :rtype: list(str)
+        """
+        notes = []
+        if untracked_cache: self.git.config('core.untrackedCache', 'true')
+        if fsmonitor and is_fsmonitor_supported(): self.git.config('core.fsmonitor', 'true')
+        elif fsmonitor: notes.append(Color.yellow('fsmonitor is not supported by this git build'))
+        return notes
+
+    def cmd_diff(self, flags, remote, branch, stream=False):
         cur_remote, cur_branch = self.get_cur_remote_branch()
         branch = branch or cur_branch
         self._assert_remote_branch(remote, branch)
         list_args = self._get_args_list(flags)
         if remote: list_args += ['%s/%s' % (remote, branch)]
         else: list_args += [branch]
+        # Only the counts travel back to the parent, never the patch
+        if 'numstat' in flags: return DiffStat.parse(self.git.diff('--numstat', list_args[-1]))
+        if stream: return self._stream_git(['diff'] + list_args)
         output = self.git.diff(*list_args)
         if not output: output = Color.yellow("There is not changes")
         return output
@@ -87,6 +221,7 @@ class Package(object):
                     output = self.cmd_rebase(remote, branch)
         finally:
             if 'stashed' in locals() and stashed: self.git.stash('pop')
+        return output
 
     def cmd_merge(self, remote, branch):
         self._assert_remote_branch(remote, branch)
@@ -128,11 +263,43 @@ class Package(object):
 
         return output
 
-    def cmd_bash(self, bash_cmd):
+    def cmd_bash(self, bash_cmd, timeout=None, stream=False):
+        """
+        :param str bash_cmd:
+        :param float timeout: Seconds before the command and its children are killed
+        :param bool stream:
+        :rtype: CommandResult
+        """
+        prefix = get_stream_prefix(self.name) if stream else None
         try:
-            return subprocess.check_output('cd %s; %s ;cd -' % (self.location, bash_cmd), shell=True)
+            return run_process(bash_cmd, self.location, timeout=timeout, shell=True, stream_prefix=prefix)
         except OSError as e:
-            return Color.red(e.strerror)
+            raise ValueError(e.strerror)
+
+    def cmd_clone(self, url, flags):
+        """
+        :param str url:
+        :param dict flags:
+        :rtype: FetchResult
+        """
+        return clone_repository(url, self.location, flags)
+
+    def cmd_fetch(self, flags, remote=None):
+        """
+        :param dict flags:
+        :param str remote: Every remote of the package when None
+        :rtype: FetchResult
+        """
+        remotes = [remote] if remote else self.get_available_remotes()
+        if remote and remote not in self.get_available_remotes():
+            raise ValueError('Remote "%s" does not exists' % remote)
+        fetches = []
+        for name in remotes:
+            fetches.append(fetch_remote(self, name, flags))
+            # Remotes left would only get the grace period of the deadline
+            if fetches[-1].status in [TIMEOUT, CANCELLED]: break
+        _fetched.update((self.location, fetch.remote) for fetch in fetches if fetch.status == PASSED)
+        return FetchResult(fetches)
 
     def cmd_checkout(self, flags, branch_name, from_branch=None):
         available_branches = self.get_available_local_branches()
@@ -210,28 +377,48 @@ class Package(object):
             if 'stashed' in locals() and stashed: self.git.stash('pop')
         return output
 
-    def _is_behind_commit(self, remote, branch):
-        # Getting number of commits behind
-        if remote:
+    def fetch(self, remote):
+        """
+        Fetches remote at most once per run, and skips it entirely while the fetch cache
+        still considers it fresh
+        :param str remote:
+        """
+        if (self.location, remote) in _fetched: return
+        if not self.fetch_cache or not self.fetch_cache.is_fresh(self.name, remote):
             self.git.fetch(remote)
-            remote_commits = self.git.log(*['--oneline', 'HEAD..%s/%s' % (remote, branch)])
-        else:
-            remote_commits = self.git.log(*['--oneline', 'HEAD..%s' % branch])
-        return len(remote_commits) > 0
+            if self.fetch_cache: self.fetch_cache.touch(self.name, remote)
+        _fetched.add((self.location, remote))
+
+    def get_ahead_behind(self, remote, branch, fetch=True):
+        """
+        Counts commits only in HEAD (ahead) and only in remote/branch (behind) with a single
+        rev-list call
+        :param str remote:
+        :param str branch:
+        :param bool fetch: Fetch remote first, otherwise its last fetched state is used
+        :rtype: (int, int)
+        """
+        if remote and fetch: self.fetch(remote)
+        target = '%s/%s' % (remote, branch) if remote else branch
+        ahead, behind = self.git.rev_list('--left-right', '--count', 'HEAD...%s' % target).split()
+        return int(ahead), int(behind)
+
+    def _is_behind_commit(self, remote, branch):
+        return self.get_ahead_behind(remote, branch)[1] > 0
 
     def _is_ahead_commit(self, remote, branch):
-        # Getting number of commits behind
-        if remote:
-            self.git.fetch(remote)
-            remote_commits = self.git.log(*['--oneline', '%s/%s..HEAD' % (remote, branch)])
-        else:
-            remote_commits = self.git.log(*['--oneline', '%s..HEAD' % branch])
-        return len(remote_commits) > 0
+        return self.get_ahead_behind(remote, branch)[0] > 0
+
+    def _stream_git(self, args):
+        """
+        Writes the git output straight to stdout, line by line, instead of buffering it
+        :param list(str) args: Git command and arguments
+        :rtype: CommandResult
+        """
+        return run_process(['git'] + args, self.location, stream_prefix=get_stream_prefix(self.name))
 
     def _has_local_changes(self):
-        local_diff = self.git.status(porcelain=True).split('\n')
-        diffs = [diff for diff in local_diff if diff]
-        return len(diffs) > 0
+        return self.get_status(branch=False).is_dirty()
 
     def _assert_remote_branch(self, remote, branch):
         if remote:
@@ -240,7 +427,24 @@ class Package(object):
             available_branches = self.get_available_remote_branches(remote)
         else:
             available_branches = self.get_available_local_branches()
-        if branch not in available_branches: raise ValueError('Branch "%s" does not exists' % branch)
+        # Local targets may also be tags, shas or expressions such as HEAD~1
+        if branch not in available_branches and (remote or not self.resolve_revision(branch)):
+            raise ValueError('Branch "%s" does not exists' % branch)
+
+    def resolve_revision(self, revision):
+        """
+        Looks up a commit-ish through the repository's persistent `git cat-file --batch-check`
+        process, so repeated lookups do not spawn git again
+        :param str revision:
+        :return: Commit sha, None if it does not exist
+        :rtype: str|None
+        """
+        # A single line is written to the batch process, it must not contain whitespaces
+        if not revision or len(revision.split()) != 1 or revision.strip() != revision: return None
+        try:
+            return self.git.get_object_header('%s^{commit}' % revision)[0]
+        except ValueError:
+            return None
 
     def _get_args_list(self, args):
         return ['%s%s' % (
@@ -0,0 +1,114 @@
+import signal
+import traceback
+
+from git import GitCommandError
+
+from helpers import Color
+from runner import TIMEOUT, CANCELLED, is_cancelled
+
+UP_TO_DATE = 'up-to-date'
+FAST_FORWARD = 'fast-forward'
+NEEDS_REBASE = 'needs-rebase'
+DIVERGED = 'diverged'
+NEW_BRANCH = 'new-branch'
+FORCE = 'force'
+INVALID = 'invalid'
+
+sync_commands = ['pull', 'push', 'merge']
+
+
+class SyncPlan(object):
+    """
+    What a pull/push/merge is expected to do on a package, computed up-front from a
+    single `git rev-list --left-right --count` per repository
+    """
+    name = None
+    target = None
+    ahead = None
+    behind = None
+    state = None
+    error = None
+
+    def __init__(self, name, target=None, ahead=None, behind=None, state=None, error=None):
+        self.name = name
+        self.target = target
+        self.ahead = ahead
+        self.behind = behind
+        self.state = state
+        self.error = error
+
+    def needs_work(self):
+        """
+        Invalid plans are executed too, so the command reports the actual error. Packages which
+        timed out or were cancelled while planning are not.
+        :rtype: bool
+        """
+        return self.state not in [UP_TO_DATE, TIMEOUT, CANCELLED]
+
+    def to_dict(self):
+        """
+        :rtype: dict
+        """
+        return {'name': self.name, 'target': self.target, 'ahead': self.ahead, 'behind': self.behind,
+                'state': self.state, 'error': self.error}
+
+    def __repr__(self):
+        return "<SyncPlan: %s(%s %s)>" % (self.name, self.target, self.state)
+
+
+def plan_package(package, git_cmd, flags, remote, branch):
+    """
+    :param Package package:
+    :param str git_cmd: pull, push or merge
+    :param dict flags: Parsed command flags
+    :param str remote: Requested remote, None for the current one (pull/push)
+    :param str branch: Requested branch, None for the current one (pull/push)
+    :rtype: SyncPlan
+    """
+    try:
+        if git_cmd != 'merge':
+            cur_remote, cur_branch = package.get_cur_remote_branch()
+            remote, branch = remote or cur_remote, branch or cur_branch
+        target = '%s/%s' % (remote, branch) if remote else branch
+        if git_cmd == 'push' and branch not in package.get_available_remote_branches(remote):
+            return SyncPlan(package.get_name(), target, state=NEW_BRANCH)
+        package._assert_remote_branch(remote, branch)
+        ahead, behind = package.get_ahead_behind(remote, branch)
+    except GitCommandError as e:
+        # Ctrl-C reaches the git processes as well, they may die before mgit cancels
+        if is_cancelled() or str(e.status) == str(-signal.SIGINT): return SyncPlan(package.get_name(), state=CANCELLED)
+        return SyncPlan(package.get_name(), state=INVALID, error=e.stderr or e.stdout)
+    except ValueError as e:
+        return SyncPlan(package.get_name(), state=INVALID, error=e.message)
+    except:
+        return SyncPlan(package.get_name(), state=INVALID, error=traceback.format_exc())
+
+    # Pull and merge bring commits in, push sends them out
+    incoming, outgoing = (ahead, behind) if git_cmd == 'push' else (behind, ahead)
+    if git_cmd == 'push' and 'force' in flags: state = FORCE if ahead or behind else UP_TO_DATE
+    elif not incoming: state = UP_TO_DATE
+    elif not outgoing: state = FAST_FORWARD
+    elif 'rebase' in flags: state = NEEDS_REBASE
+    else: state = DIVERGED
+    return SyncPlan(package.get_name(), target, ahead, behind, state)
+
+
+def format_plans(plans):
+    """
+    :param list(SyncPlan) plans:
+    :rtype: str
+    """
+    colors = {UP_TO_DATE: Color.green, FAST_FORWARD: Color.green, NEW_BRANCH: Color.green,
+              NEEDS_REBASE: Color.yellow, FORCE: Color.yellow, DIVERGED: Color.red, INVALID: Color.red,
+              TIMEOUT: Color.red, CANCELLED: Color.yellow}
+    width = max([len(plan.name) for plan in plans] + [len('Package')])
+    target_width = max([len(plan.target or '') for plan in plans] + [len('Target')])
+    lines = ['%s  %s  %6s  %6s  %s' % ('Package'.ljust(width), 'Target'.ljust(target_width), 'Ahead', 'Behind', 'State')]
+    for plan in plans:
+        line = '%s  %s  %6s  %6s  %s' % (
+            plan.name.ljust(width), (plan.target or '').ljust(target_width),
+            '-' if plan.ahead is None else plan.ahead, '-' if plan.behind is None else plan.behind,
+            colors[plan.state](plan.state))
+        if plan.error: line += '  ' + Color.red(plan.error.strip().split('\n')[-1])
+        lines.append(line)
+    return '\n'.join(lines)
@@ -0,0 +1,167 @@
+import json
+import shutil
+import tempfile
+import threading
+import time
+from os import path, environ, getpid, listdir
+
+from git import Repo, GitCommandError
+from git.cmd import Git
+
+from helpers import Color
+import deadline
+
+# Folder collecting the events of every process, set when --profile is on. Being an
+# environment variable it reaches forked pool workers too.
+PROFILE_ENV = 'mgit.profile'
+
+_trace_lock = threading.Lock()
+
+
+def enable():
+    """
+    :return: Folder the events are written to
+    :rtype: str
+    """
+    environ[PROFILE_ENV] = tempfile.mkdtemp(prefix='mgit-profile-')
+    return environ[PROFILE_ENV]
+
+
+def is_enabled():
+    """
+    :rtype: bool
+    """
+    return bool(environ.get(PROFILE_ENV))
+
+
+def record(location, command, started, status, n_bytes=None):
+    """
+    Appends an event to this process' trace file. Each process writes its own file, so
+    no locking is needed between pool workers.
+    :param str location: Package folder
+    :param list(str)|str command:
+    :param float started: time.time() when the command started
+    :param int|str status: Exit code, or a label such as "timeout"
+    :param int n_bytes: Size of the output
+    """
+    folder = environ.get(PROFILE_ENV)
+    if not folder: return
+    event = {
+        'location': location,
+        'command': command if isinstance(command, basestring) else ' '.join(command),
+        'started': started,
+        'duration': time.time() - started,
+        'status': status,
+        'bytes': n_bytes,
+        'pid': getpid(),
+        'tid': threading.current_thread().ident,
+    }
+    with _trace_lock:
+        with open(path.join(folder, '%d.jsonl' % getpid()), 'a') as stream:
+            stream.write(json.dumps(event) + '\n')
+
+
+class TracingGit(Git):
+    """
+    Git command wrapper recording every invocation when profiling is enabled. Commands of a package
+    with a deadline run in its process group, killed with everything they spawned once it passes.
+    """
+    def execute(self, command, **kwargs):
+        if not kwargs.get('as_process'):
+            pgid = deadline.get_group()
+            if pgid and 'preexec_fn' not in kwargs: kwargs['preexec_fn'] = lambda: deadline.join_group(pgid)
+            # Started once the deadline passed, e.g. restoring a stash, it only gets the grace period
+            if deadline.is_expired() and kwargs.get('kill_after_timeout') is None:
+                kwargs['kill_after_timeout'] = deadline.GRACE
+        if not is_enabled() or kwargs.get('as_process'): return Git.execute(self, command, **kwargs)
+        started = time.time()
+        try:
+            output = Git.execute(self, command, **kwargs)
+        except GitCommandError as e:
+            record(self.working_dir, command, started, e.status,
+                   len(e.stdout or '') + len(e.stderr or ''))
+            raise
+        n_bytes = len(output[1]) if isinstance(output, tuple) else len(output or '')
+        record(self.working_dir, command, started, 0, n_bytes)
+        return output
+
+
+class TracingRepo(Repo):
+    GitCommandWrapperType = TracingGit
+
+
+def collect(folder):
+    """
+    Reads and removes the events of every process
+    :param str folder:
+    :rtype: list(dict)
+    """
+    events = []
+    for trace_file in listdir(folder):
+        with open(path.join(folder, trace_file)) as stream:
+            events += [json.loads(line) for line in stream if line.strip()]
+    shutil.rmtree(folder, ignore_errors=True)
+    # GitPython normalizes its working dir, so locations are compared by real path
+    for event in events: event['location'] = path.realpath(event['location'])
+    return sorted(events, key=lambda event: event['started'])
+
+
+def format_report(events, names, top=10):
+    """
+    Time per git subcommand and the slowest invocations
+    :param list(dict) events:
+    :param dict names: Package name by real path of its location
+    :param int top: Number of slowest invocations listed
+    :rtype: str
+    """
+    git_events = [event for event in events if event['command'].startswith('git ')]
+    by_command = dict()
+    for event in git_events:
+        subcommand = event['command'].split(' ')[1]
+        count, total, n_bytes = by_command.get(subcommand, (0, 0.0, 0))
+        by_command[subcommand] = (count + 1, total + event['duration'], n_bytes + (event['bytes'] or 0))
+
+    lines = [Color.yellow('Git time by command'), '%-16s %6s %10s %12s' % ('Command', 'Calls', 'Total', 'Bytes')]
+    for subcommand, (count, total, n_bytes) in sorted(by_command.items(), key=lambda item: -item[1][1]):
+        lines.append('%-16s %6d %9.3fs %12d' % (subcommand, count, total, n_bytes))
+
+    lines += ['', Color.yellow('Slowest git invocations')]
+    for event in sorted(git_events, key=lambda event: -event['duration'])[:top]:
+        status = '' if event['status'] == 0 else Color.red(' [%s]' % event['status'])
+        lines.append('%8.3fs  %-20s %s%s' % (event['duration'], names.get(event['location'], event['location']),
+                                           event['command'][:80], status))
+
+    # Git time spent inside every package command, the rest of it is python overhead
+    packages = [event for event in events if event['command'].startswith('mgit ')]
+    if packages:
+        mgit_total, inner_git = sum(event['duration'] for event in packages), 0.0
+        for package in packages:
+            inner_git += sum(event['duration'] for event in git_events
+                             if event['location'] == package['location']
+                             and package['started'] <= event['started'] <= package['started'] + package['duration'])
+        lines += ['', 'Package commands: %.3fs, git: %.3fs, python overhead: %.3fs' % (
+            mgit_total, inner_git, max(0.0, mgit_total - inner_git))]
+        lines.append('Git outside package commands (discovery, planning): %.3fs' % (
+            sum(event['duration'] for event in git_events) - inner_git))
+    return '\n'.join(lines)
+
+
+def write_trace(events, names, output, output_format='chrome'):
+    """
+    :param list(dict) events:
+    :param dict names: Package name by real path of its location
+    :param str output: File path
+    :param str output_format: "chrome" (chrome://tracing, one lane per worker) or "json" (raw events)
+    """
+    for event in events: event['package'] = names.get(event['location'], event['location'])
+    if output_format == 'json':
+        data = events
+    else:
+        origin = min([event['started'] for event in events] or [0])
+        data = {'traceEvents': [{
+            'name': event['command'][:120], 'cat': event['package'], 'ph': 'X',
+            'ts': int((event['started'] - origin) * 1e6), 'dur': int(event['duration'] * 1e6),
+            'pid': event['pid'], 'tid': event['tid'],
+            'args': {'package': event['package'], 'status': event['status'], 'bytes': event['bytes']},
+        } for event in events]}
+    with open(output, 'w') as stream: json.dump(data, stream)
@@ -0,0 +1,211 @@
+import threading
+from os import path, walk
+
+# Parsed packed-refs/config files by path, along with the (mtime, size) they were parsed at
+_files_cache = dict()
+_files_lock = threading.Lock()
+
+
+class RefReader(object):
+    """
+    Resolves branches, remotes and HEAD straight from the files of a .git folder (HEAD, loose
+    refs, packed-refs and config) instead of GitPython's object model or a git subprocess.
+    packed-refs and config are parsed once and reused until their mtime or size changes.
+    """
+    git_dir = None
+    common_dir = None
+
+    def __init__(self, location):
+        """
+        :param str location: Repository working tree
+        """
+        self.git_dir = RefReader.get_git_dir(location)
+        # Linked worktrees keep their own HEAD but share refs and config with the main repository
+        common_dir = self._read(path.join(self.git_dir, 'commondir'))
+        self.common_dir = path.normpath(path.join(self.git_dir, common_dir.strip())) if common_dir else self.git_dir
+
+    @staticmethod
+    def get_git_dir(location):
+        """
+        :param str location: Repository working tree
+        :rtype: str
+        """
+        git_dir = path.join(location, '.git')
+        if path.isfile(git_dir):
+            # Submodules and worktrees: ".git" is a file pointing to the actual folder
+            with open(git_dir) as stream: content = stream.read().strip()
+            if content.startswith('gitdir:'):
+                git_dir = path.normpath(path.join(location, content[len('gitdir:'):].strip()))
+        return git_dir
+
+    def get_head(self):
+        """
+        :return: Current branch name, None when detached, and the commit HEAD points to
+        :rtype: (str, str)
+        """
+        head = (self._read(path.join(self.git_dir, 'HEAD')) or '').strip()
+        if not head.startswith('ref: '): return None, head or None
+        ref = head[len('ref: '):]
+        branch = ref[len('refs/heads/'):] if ref.startswith('refs/heads/') else None
+        return branch, self.resolve(ref)
+
+    def get_head_branch(self):
+        """
+        :rtype: str|None
+        """
+        return self.get_head()[0]
+
+    def resolve(self, ref, depth=5):
+        """
+        :param str ref: Full ref name, e.g. refs/heads/master
+        :param int depth: Max symbolic refs followed
+        :return: Commit sha, None if the ref does not exist (e.g. branch without commits)
+        :rtype: str|None
+        """
+        content = self._read(path.join(self.git_dir if ref == 'HEAD' else self.common_dir, ref))
+        if content is not None:
+            content = content.strip()
+            if content.startswith('ref: '):
+                return self.resolve(content[len('ref: '):], depth - 1) if depth else None
+            return content
+        return self._get_packed_refs().get(ref)
+
+    def has_ref(self, ref):
+        """
+        :param str ref: Full ref name
+        :rtype: bool
+        """
+        return path.isfile(path.join(self.common_dir, ref)) or ref in self._get_packed_refs()
+
+    def get_branches(self):
+        """
+        :rtype: list(str)
+        """
+        return self._list_refs('refs/heads/')
+
+    def get_remote_branches(self, remote):
+        """
+        :param str remote:
+        :rtype: list(str)
+        """
+        return self._list_refs('refs/remotes/%s/' % remote)
+
+    def get_remotes(self):
+        """
+        :return: Remote names, in config order
+        :rtype: list(str)
+        """
+        return [name for section, name in self._get_config()['sections'] if section == 'remote']
+
+    def get_remote_url(self, remote):
+        """
+        :param str remote:
+        :rtype: str|None
+        """
+        return self._get_config()['values'].get(('remote', remote, 'url'))
+
+    def get_upstream(self, branch):
+        """
+        :param str branch:
+        :return: Remote and branch tracked by branch, (None, None) when not tracking
+        :rtype: (str, str)
+        """
+        values = self._get_config()['values']
+        remote, merge = values.get(('branch', branch, 'remote')), values.get(('branch', branch, 'merge'))
+        if not remote or not merge: return None, None
+        return remote, merge[len('refs/heads/'):] if merge.startswith('refs/heads/') else merge
+
+    def _list_refs(self, prefix):
+        """
+        Loose refs below prefix merged with packed ones, names without the prefix
+        :param str prefix:
+        :rtype: list(str)
+        """
+        names = set(ref[len(prefix):] for ref in self._get_packed_refs() if ref.startswith(prefix))
+        folder = path.join(self.common_dir, prefix)
+        for dir_path, dir_names, file_names in walk(folder):
+            relative = path.relpath(dir_path, folder)
+            for file_name in file_names:
+                if file_name.endswith('.lock'): continue
+                names.add(file_name if relative == '.' else path.join(relative, file_name))
+        return sorted(names)
+
+    def _get_packed_refs(self):
+        """
+        :rtype: dict
+        """
+        return RefReader._get_parsed(path.join(self.common_dir, 'packed-refs'), RefReader._parse_packed_refs)
+
+    def _get_config(self):
+        """
+        :rtype: dict
+        """
+        return RefReader._get_parsed(path.join(self.common_dir, 'config'), RefReader._parse_config)
+
+    @staticmethod
+    def _get_parsed(file_path, parser):
+        """
+        :param str file_path:
+        :param callable parser: Builds the cached value from the file content
+        """
+        try:
+            stat = path.getmtime(file_path), path.getsize(file_path)
+        except OSError:
+            stat = None
+        cached = _files_cache.get(file_path)
+        if cached and cached[0] == stat: return cached[1]
+        parsed = parser(RefReader._read(file_path) or '')
+        with _files_lock: _files_cache[file_path] = (stat, parsed)
+        return parsed
+
+    @staticmethod
+    def _parse_packed_refs(content):
+        """
+        :param str content:
+        :rtype: dict
+        """
+        refs = dict()
+        for line in content.split('\n'):
+            # Comments, and "^sha" lines holding the commit an annotated tag peels to
+            if not line or line[0] in '#^': continue
+            sha, ref = line.split(' ', 1)
+            refs[ref.strip()] = sha
+        return refs
+
+    @staticmethod
+    def _parse_config(content):
+        """
+        Minimal git-config parser, enough for remotes and branch tracking
+        :param str content:
+        :return: Ordered (section, subsection) list and values by (section, subsection, key)
+        :rtype: dict
+        """
+        sections, values, section = [], dict(), (None, None)
+        for line in content.split('\n'):
+            line = line.strip()
+            if not line or line[0] in '#;': continue
+            if line.startswith('['):
+                header = line[1:line.index(']')].strip()
+                if '"' in header:
+                    name, subsection = header.split('"')[0].strip(), header.split('"')[1]
+                elif '.' in header:
+                    name, subsection = header.split('.', 1)
+                else:
+                    name, subsection = header, None
+                section = (name.lower(), subsection)
+                if section not in sections: sections.append(section)
+            elif '=' in line:
+                key, value = line.split('=', 1)
+                values[section + (key.strip().lower(),)] = value.strip().strip('"')
+        return {'sections': sections, 'values': values}
+
+    @staticmethod
+    def _read(file_path):
+        """
+        :param str file_path:
+        :rtype: str|None
+        """
+        try:
+            with open(file_path) as stream: return stream.read()
+        except IOError:
+            return None
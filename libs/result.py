@@ -0,0 +1,132 @@
+import json
+import re
+import sys
+import time
+
+from runner import PASSED
+
+ERROR = 'error'
+_COLORS_RE = re.compile(r'\x1b\[[0-9;]*[a-zA-Z]')
+
+
+class PackageResult(object):
+    """
+    Outcome of a command on a package. It is built by the worker that ran the command, including
+    the branch the package ends up on, so the parent renders it without touching the repository.
+    """
+    name = None
+    location = None
+    command = None
+    status = None
+    branch = None
+    started = None
+    duration = None
+    output = None
+    error_type = None
+    details = None
+
+    def __init__(self, name, location, command, status, branch, started, duration, output,
+                 error_type=None, details=None):
+        """
+        :param str name: Package name
+        :param str location:
+        :param str command: mgit command, e.g. "pull"
+        :param str status: passed, failed, timeout, cancelled or error
+        :param str branch: Current branch once the command completed, None when detached
+        :param float started: Timestamp
+        :param float duration: Seconds
+        :param str output: Rendered output, UTF-8 bytes, only the summary line when it was streamed
+        :param str error_type: Exception raised by the command, e.g. GitCommandError
+        :param dict details: Command specific data, e.g. exit code or bytes received
+        """
+        self.name = name
+        self.location = location
+        self.command = command
+        self.status = status
+        self.branch = branch
+        self.started = started
+        self.duration = duration
+        self.output = output
+        self.error_type = error_type
+        self.details = details
+
+    @staticmethod
+    def create(package, command, value, started, error_type=None, status=None):
+        """
+        :param Package package:
+        :param str command:
+        :param str|CommandResult|FetchResult value: What the command returned, or the error message
+        :param float started:
+        :param str error_type:
+        :param str status: Overrides the one of value, e.g. timeout when the command was killed
+        :rtype: PackageResult
+        """
+        try:
+            branch = package.refs.get_head_branch()
+        except (IOError, OSError):
+            branch = None
+        status = status or (ERROR if error_type else getattr(value, 'status', PASSED))
+        details = value.to_dict() if hasattr(value, 'to_dict') else None
+        return PackageResult(package.get_name(), package.location, command, status, branch, started,
+                             time.time() - started, encode_output(value), error_type, details)
+
+    def to_dict(self):
+        """
+        :rtype: dict
+        """
+        return {
+            'name': self.name,
+            'location': self.location,
+            'command': self.command,
+            'status': self.status,
+            'branch': self.branch,
+            'started': self.started,
+            'duration': round(self.duration, 3),
+            'output': strip_colors(self.output.decode('utf-8', 'replace')),
+            'error_type': self.error_type,
+            'details': self.details,
+        }
+
+    def __repr__(self):
+        return "<PackageResult: %s(%s)>" % (self.name, self.status)
+
+
+def encode_output(value):
+    """
+    Output is kept as bytes so it prints whatever the encoding of stdout (a pipe, CI logs...),
+    only JSON documents decode it
+    :param str|unicode|object value:
+    :rtype: str
+    """
+    if isinstance(value, unicode): return value.encode('utf-8')
+    output = value if isinstance(value, str) else value.__str__()
+    return output.encode('utf-8') if isinstance(output, unicode) else output
+
+
+def strip_colors(text):
+    """
+    :param unicode text:
+    :rtype: unicode
+    """
+    return _COLORS_RE.sub('', text or '')
+
+
+def write_json(git_cmd, results, plans=None, out=None):
+    """
+    One JSON document with every result, and the sync plans when there are some
+    :param str git_cmd:
+    :param list(PackageResult) results:
+    :param list(SyncPlan) plans:
+    :param file out: Defaults to sys.stdout
+    """
+    counters = dict()
+    for result in results: counters[result.status] = counters.get(result.status, 0) + 1
+    document = {
+        'command': git_cmd,
+        'packages': [result.to_dict() for result in sorted(results, key=lambda r: r.name)],
+        'summary': counters,
+    }
+    if plans is not None: document['plan'] = [plan.to_dict() for plan in plans]
+    out = out or sys.stdout
+    json.dump(document, out, indent=2, sort_keys=True)
+    out.write('\n')
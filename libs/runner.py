@@ -0,0 +1,195 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from helpers import Color
+from profiler import record
+import deadline
+
+PASSED = 'passed'
+FAILED = 'failed'
+TIMEOUT = 'timeout'
+CANCELLED = 'cancelled'
+
+# Serializes writes of threads sharing this process' stdout
+_output_lock = threading.Lock()
+# Process groups started by run_process and still running, by pid. No lock: cancel() may run
+# from a signal handler interrupting a thread which holds it.
+_running = set()
+_cancelled = threading.Event()
+
+
+class CommandResult(object):
+    """
+    Outcome of a command run on a package, output is None when it was streamed
+    """
+    status = None
+    exit_code = None
+    duration = None
+    output = None
+    n_lines = None
+
+    def __init__(self, status, exit_code, duration, output=None, n_lines=None):
+        self.status = status
+        self.exit_code = exit_code
+        self.duration = duration
+        self.output = output
+        self.n_lines = n_lines
+
+    def get_summary(self):
+        """
+        :rtype: str
+        """
+        if self.status == TIMEOUT: return Color.red('Timed out after %.1fs' % self.duration)
+        if self.status == CANCELLED: return Color.yellow('Cancelled after %.1fs' % self.duration)
+        message = 'Exited with code %d in %.1fs' % (self.exit_code, self.duration)
+        if self.n_lines is not None: message = 'Streamed %d lines. %s' % (self.n_lines, message)
+        return Color.green(message) if self.status == PASSED else Color.red(message)
+
+    def to_dict(self):
+        """
+        :rtype: dict
+        """
+        return {'exit_code': self.exit_code, 'duration': round(self.duration, 3), 'n_lines': self.n_lines}
+
+    def __str__(self):
+        if not self.output: return self.get_summary()
+        return '%s\n%s' % (self.output.rstrip('\n'), self.get_summary())
+
+    def __repr__(self):
+        return "<CommandResult: %s(%s)>" % (self.status, self.exit_code)
+
+
+def run_process(args, cwd, timeout=None, shell=False, stream_prefix=None, out=None):
+    """
+    Runs a process in cwd merging stdout and stderr. The process gets its own process group so
+    that a timeout kills everything it spawned, not only the shell.
+    :param list(str)|str args: Command, a string when shell is True
+    :param str cwd: Folder to run the command from
+    :param float timeout: Seconds before the process is killed, defaults to what is left before the
+        deadline of the package. None or 0 without deadline to wait forever
+    :param bool shell:
+    :param str stream_prefix: When given, output is copied line by line to out with this prefix
+        instead of being captured, so memory stays constant whatever the output size
+    :param file out: Defaults to sys.stdout
+    :rtype: CommandResult
+    """
+    started = time.time()
+    process = subprocess.Popen(args, cwd=cwd, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               preexec_fn=os.setpgrp)
+    _running.add(process.pid)
+    # Cancelled while it was starting
+    if _cancelled.is_set(): _kill_group(process.pid)
+    timeout = timeout or deadline.remaining()
+    timed_out = threading.Event()
+    timer = threading.Timer(timeout, _kill_process, [process, timed_out]) if timeout else None
+    if timer: timer.start()
+    output, n_lines, n_bytes = None, None, 0
+    try:
+        if stream_prefix is None:
+            output = process.communicate()[0]
+            n_bytes = len(output)
+        else:
+            out, n_lines = out or sys.stdout, 0
+            for line in iter(process.stdout.readline, b''):
+                with _output_lock:
+                    out.write(stream_prefix + line)
+                    out.flush()
+                n_lines += 1
+                n_bytes += len(line)
+            process.stdout.close()
+        exit_code = process.wait()
+    except KeyboardInterrupt:
+        # Serial executor, the process has its own group so Ctrl-C did not reach it
+        cancel()
+        raise
+    finally:
+        if timer: timer.cancel()
+        _running.discard(process.pid)
+
+    if timed_out.is_set(): status = TIMEOUT
+    elif exit_code < 0 and _cancelled.is_set(): status = CANCELLED
+    else: status = PASSED if exit_code == 0 else FAILED
+    record(cwd, args, started, status if status in [TIMEOUT, CANCELLED] else exit_code, n_bytes)
+    return CommandResult(status, exit_code, time.time() - started, output, n_lines)
+
+
+def _kill_process(process, timed_out):
+    """
+    :param subprocess.Popen process:
+    :param threading.Event timed_out:
+    """
+    timed_out.set()
+    _kill_group(process.pid)
+
+
+def _kill_group(pid):
+    """
+    :param int pid: Process group leader
+    """
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        # Already finished
+        pass
+
+
+def cancel():
+    """
+    Kills the processes run_process started in this process and the git processes of the packages
+    with a deadline, and makes the packages not started yet return right away
+    """
+    _cancelled.set()
+    for pid in list(_running): _kill_group(pid)
+    deadline.kill_groups()
+
+
+def is_cancelled():
+    """
+    :rtype: bool
+    """
+    return _cancelled.is_set()
+
+
+def init_worker():
+    """
+    Process pool workers cancel their package on Ctrl-C. Dying with KeyboardInterrupt instead
+    would leave the pool waiting for a result which never comes.
+    """
+    signal.signal(signal.SIGINT, lambda signum, frame: cancel())
+
+
+def get_stream_prefix(name):
+    """
+    :param str name: Package name
+    :rtype: str
+    """
+    return Color.build(name, Color._BLUE) + ' | '
+
+
+def format_results(results):
+    """
+    Pass/fail/timeout table of the packages which ran a command
+    :param list(PackageResult) results: Their details are the CommandResult ones, None when the
+        package failed before running the command
+    :rtype: str
+    """
+    width = max([len(result.name) for result in results] + [len('Package')])
+    lines = ['%s  %-9s  %4s  %8s' % ('Package'.ljust(width), 'Status', 'Code', 'Time')]
+    counters = dict()
+    for result in sorted(results, key=lambda r: r.name):
+        status = result.status
+        if result.details:
+            code = '-' if status in [TIMEOUT, CANCELLED] else str(result.details['exit_code'])
+            duration = '%7.1fs' % result.details['duration']
+        else:
+            code, duration = '-', '-'
+        counters[status] = counters.get(status, 0) + 1
+        color = Color.green if status == PASSED else Color.yellow if status == CANCELLED else Color.red
+        lines.append('%s  %s  %4s  %8s' % (result.name.ljust(width), color(status.ljust(9)), code, duration))
+    lines.append(', '.join('%d %s' % (counters.get(status, 0), status)
+                           for status in [PASSED, FAILED, TIMEOUT, CANCELLED, 'error']))
+    return '\n'.join(lines)
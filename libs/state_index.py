@@ -0,0 +1,123 @@
+import json
+import time
+import threading
+from os import path, makedirs, rename, environ, getpid
+
+# Seconds a clean flag is trusted by default
+DEFAULT_TTL = 60
+
+
+class StateIndex(object):
+    """
+    Workspace level cache of every package's HEAD commit, branch, upstream and dirty flag,
+    stored in `<workspace>/.mgit/index.json`.
+    Branch data is read straight from the .git files (see RefReader).
+    An entry is reused while the mtimes of the package's `.git/HEAD`, `.git/index`,
+    `.git/config`, `.git/packed-refs` and current branch ref are unchanged, so only repos
+    whose metadata moved run git again. Editing a tracked file does not touch any of those,
+    therefore a clean flag is additionally trusted only for `state.ttl` seconds. A dirty flag is
+    trusted as long as the metadata is unchanged: committing, stashing or resetting the changes
+    moves it, and a stale dirty flag only runs the command on one package too many.
+    """
+    file = None
+    ttl = DEFAULT_TTL
+    entries = None
+    changed = False
+
+    def __init__(self, workspace, ttl=None):
+        """
+        :param str workspace: Workspace folder
+        :param int ttl: Seconds the clean flag of an unchanged repo is trusted (state.ttl)
+        """
+        self.file = path.join(workspace, '.mgit', 'index.json')
+        self.ttl = int(environ.get('state.ttl', DEFAULT_TTL)) if ttl is None else ttl
+        self.entries = dict()
+        self._lock = threading.Lock()
+        if path.isfile(self.file):
+            try:
+                with open(self.file) as stream: self.entries = json.load(stream)
+            except ValueError:
+                # Corrupted index, it is rebuilt from scratch
+                self.entries = dict()
+
+    def get_remote_branch(self, package):
+        """
+        Same as `Package.get_cur_remote_branch(True)`
+        :param Package package:
+        :rtype: str
+        """
+        return self._get_entry(package)['remote_branch']
+
+    def has_local_changes(self, package):
+        """
+        :param Package package:
+        :rtype: bool
+        """
+        entry = self._get_entry(package)
+        with self._lock:
+            dirty, checked_at = entry['dirty'], entry['checked_at']
+        if dirty or (dirty is not None and time.time() - checked_at < self.ttl): return dirty
+        dirty = package._has_local_changes()
+        # git status refreshes .git/index, which is not a change of the repository
+        stamp = StateIndex.get_stamp(package.refs)
+        with self._lock:
+            entry['dirty'], entry['checked_at'], entry['stamp'] = dirty, time.time(), stamp
+            self.changed = True
+        return dirty
+
+    def save(self):
+        with self._lock:
+            if not self.changed: return
+            if not path.isdir(path.dirname(self.file)): makedirs(path.dirname(self.file))
+            tmp_file = '%s.%d' % (self.file, getpid())
+            with open(tmp_file, 'w') as stream: json.dump(self.entries, stream)
+            rename(tmp_file, self.file)
+            self.changed = False
+
+    def _get_entry(self, package):
+        """
+        :param Package package:
+        :rtype: dict
+        """
+        stamp = StateIndex.get_stamp(package.refs)
+        with self._lock:
+            entry = self.entries.get(package.location)
+        if entry and entry['stamp'] == stamp: return entry
+
+        branch, head = package.refs.get_head()
+        upstream = package.refs.get_upstream(branch) if branch else (None, None)
+        entry = {
+            'stamp': stamp,
+            'head': head,
+            'branch': branch,
+            'upstream': '/'.join(upstream) if upstream[0] else None,
+            'remote_branch': package.get_cur_remote_branch(True),
+            'dirty': None,
+            'checked_at': None,
+        }
+        with self._lock:
+            self.entries[package.location] = entry
+            self.changed = True
+        return entry
+
+    @staticmethod
+    def get_stamp(refs):
+        """
+        :param RefReader refs: Package refs
+        :rtype: list(float)
+        """
+        files = [path.join(refs.git_dir, 'HEAD'), path.join(refs.git_dir, 'index'),
+                 path.join(refs.common_dir, 'config'), path.join(refs.common_dir, 'packed-refs')]
+        try:
+            with open(files[0]) as stream: head = stream.read().strip()
+        except IOError:
+            head = ''
+        if head.startswith('ref: '): files.append(path.join(refs.common_dir, head[len('ref: '):]))
+        return [StateIndex._get_mtime(f) for f in files]
+
+    @staticmethod
+    def _get_mtime(file_path):
+        try:
+            return path.getmtime(file_path)
+        except OSError:
+            return None
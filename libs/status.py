@@ -0,0 +1,109 @@
+from helpers import Color
+from runner import PASSED
+
+
+class WorkingTreeStatus(object):
+    """
+    Branch, upstream, ahead/behind and change counts of a package, parsed from a single
+    `git status --porcelain=v2 --branch`
+    """
+    status = PASSED
+    branch = None
+    upstream = None
+    ahead = None
+    behind = None
+    staged = 0
+    unstaged = 0
+    untracked = 0
+    conflicts = 0
+    notes = None
+
+    def __init__(self):
+        self.notes = []
+
+    @staticmethod
+    def parse(porcelain):
+        """
+        :param str porcelain: `git status --porcelain=v2 [--branch]` output
+        :rtype: WorkingTreeStatus
+        """
+        status = WorkingTreeStatus()
+        for line in porcelain.split('\n'):
+            if line.startswith('# branch.head '):
+                head = line[len('# branch.head '):]
+                status.branch = None if head == '(detached)' else head
+            elif line.startswith('# branch.upstream '):
+                status.upstream = line[len('# branch.upstream '):]
+            elif line.startswith('# branch.ab '):
+                ahead, behind = line[len('# branch.ab '):].split()
+                status.ahead, status.behind = int(ahead), -int(behind)
+            elif line.startswith('1 ') or line.startswith('2 '):
+                # "XY" holds the index (staged) and working tree (unstaged) state, "." when unchanged
+                if line[2] != '.': status.staged += 1
+                if line[3] != '.': status.unstaged += 1
+            elif line.startswith('u '):
+                status.conflicts += 1
+            elif line.startswith('? '):
+                status.untracked += 1
+        return status
+
+    def is_dirty(self):
+        """
+        :rtype: bool
+        """
+        return bool(self.staged or self.unstaged or self.untracked or self.conflicts)
+
+    def to_dict(self):
+        """
+        :rtype: dict
+        """
+        return {'branch': self.branch, 'upstream': self.upstream, 'ahead': self.ahead, 'behind': self.behind,
+                'staged': self.staged, 'unstaged': self.unstaged, 'untracked': self.untracked,
+                'conflicts': self.conflicts, 'notes': self.notes}
+
+    def __str__(self):
+        counts = '%d staged, %d unstaged, %d untracked' % (self.staged, self.unstaged, self.untracked)
+        if self.conflicts: counts += Color.red(', %d conflicts' % self.conflicts)
+        sync = ' [+%d -%d]' % (self.ahead, self.behind) if self.ahead is not None else ''
+        return '\n'.join(['%s%s: %s' % (self.upstream or 'no upstream', sync, counts)] + self.notes)
+
+
+def format_statuses(results):
+    """
+    One line per package: branch, upstream, ahead/behind and change counts
+    :param list(PackageResult) results: Their details are the WorkingTreeStatus ones, None on failure,
+        timeout or cancellation
+    :rtype: str
+    """
+    width = max([len(result.name) for result in results] + [len('Package')])
+    rows = []
+    for result in sorted(results, key=lambda r: r.name):
+        status = result.details
+        if not status:
+            rows.append((result.name, result.status, '', '', '', '', '', ''))
+            continue
+        sync = '+%d -%d' % (status['ahead'], status['behind']) if status['ahead'] is not None else ''
+        rows.append((result.name, status['branch'] or 'detached', status['upstream'] or '-', sync,
+                     _count(status['staged'], 6, Color.green), _count(status['unstaged'], 8, Color.red),
+                     _count(status['untracked'], 9, Color.yellow), _count(status['conflicts'], 9, Color.red)))
+    branch_width = max([len(row[1]) for row in rows] + [len('Branch')])
+    upstream_width = max([len(row[2]) for row in rows] + [len('Upstream')])
+    line = '%s  %s  %s  %9s  %6s  %8s  %9s  %9s'
+    # Counts are padded before being colored, color codes would count as characters otherwise
+    lines = [line % ('Package'.ljust(width), 'Branch'.ljust(branch_width), 'Upstream'.ljust(upstream_width),
+                     'Sync', 'Staged', 'Unstaged', 'Untracked', 'Conflicts')]
+    for name, branch, upstream, sync, staged, unstaged, untracked, conflicts in rows:
+        lines.append(line % (name.ljust(width), branch.ljust(branch_width), upstream.ljust(upstream_width), sync,
+                             staged, unstaged, untracked, conflicts))
+    notes = set(note for result in results if result.details for note in result.details['notes'])
+    return '\n'.join(lines + sorted(notes))
+
+
+def _count(count, width, color):
+    """
+    :param int count:
+    :param int width:
+    :param callable color: Applied when count is not 0
+    :rtype: str
+    """
+    return color(str(count).rjust(width)) if count else '.'.rjust(width)
@@ -0,0 +1,178 @@
+import heapq
+import subprocess
+import threading
+import time
+from datetime import datetime
+from os import path
+
+from helpers import Color, thread_map
+from profiler import record
+
+# Commit date, hash, author and subject of every commit, NUL separated
+LOG_FORMAT = '%ct%x00%h%x00%an%x00%s'
+# Commits a buffered stream holds at once
+LOG_CHUNK = 200
+
+
+class LogStream(object):
+    """
+    `git log` of a package read lazily, one commit at a time. git blocks once the pipe is full,
+    so only the commits actually consumed are ever produced. A buffered stream reads `chunk`
+    commits at a time instead, its git process is done before they are merged, and the next
+    chunk is only read (skipping the ones already read) once the merge consumed them. git is
+    killed once the timeout of the package passed.
+    """
+    package = None
+    target = None
+    base_args = None
+    args = None
+    process = None
+    started = None
+    spent = 0
+    n = None
+    chunk = None
+    n_commits = 0
+    exhausted = False
+    lines = None
+    error = None
+    timeout = 0
+    timer = None
+    timed_out = False
+
+    def __init__(self, package, target, n=None, since=None, timeout=0, chunk=None):
+        """
+        :param Package package:
+        :param str target: Revision to log
+        :param int n: Max commits read
+        :param str since: Any date `git log --since` understands, e.g. "yesterday"
+        :param float timeout: Seconds git may run, 0 for no limit
+        :param int chunk: Commits read at a time by `buffer`
+        """
+        self.package = package
+        self.n = n
+        self.timeout = timeout
+        self.chunk = min(chunk or LOG_CHUNK, n or LOG_CHUNK)
+        self.target = target
+        self.base_args = ['git', 'log', '--date-order', '--format=' + LOG_FORMAT]
+        if since: self.base_args += ['--since=' + since]
+
+    def start(self, limit=None):
+        """
+        :param int limit: Max commits, after the ones already read, n when None
+        :rtype: LogStream
+        """
+        self.started, self.exhausted = time.time(), False
+        args = list(self.base_args)
+        if limit or self.n: args += ['-n', str(limit or self.n)]
+        if self.n_commits: args += ['--skip=%d' % self.n_commits]
+        self.args = args + [self.target, '--']
+        self.process = subprocess.Popen(self.args, cwd=self.package.location, bufsize=-1, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+        # Shared by every git process of the stream
+        if self.timeout:
+            self.timer = threading.Timer(max(self.timeout - self.spent, 0), self._kill)
+            self.timer.daemon = True
+            self.timer.start()
+        return self
+
+    def _kill(self):
+        if self.process.poll() is not None: return
+        self.timed_out = True
+        self.process.kill()
+
+    def buffer(self):
+        """
+        Reads the next chunk of commits and waits for git
+        :rtype: LogStream
+        """
+        self.start(min(self.chunk, self.n - self.n_commits) if self.n else self.chunk)
+        self.lines = self.process.stdout.readlines()
+        self.exhausted = True
+        self.error = self.close()
+        return self
+
+    def has_more(self):
+        """
+        :return: Whether the last chunk was full, so git may have more commits
+        :rtype: bool
+        """
+        if self.error or len(self.lines) < self.chunk: return False
+        return not self.n or self.n_commits < self.n
+
+    def __iter__(self):
+        """
+        :return: Negated commit date first, so streams merge newest first
+        :rtype: generator((int, str, str, str, str))
+        """
+        while True:
+            lines = self.lines if self.lines is not None else iter(self.process.stdout.readline, b'')
+            for line in lines:
+                timestamp, sha, author, subject = line.rstrip('\n').split('\x00', 3)
+                self.n_commits += 1
+                yield -int(timestamp), self.package.get_name(), sha, author, subject
+            self.exhausted = True
+            if self.lines is None or not self.has_more(): return
+            self.buffer()
+
+    def close(self):
+        """
+        Stops git if it is still running, e.g. the merge did not need the rest of its commits
+        :return: git error output, None when it succeeded or was stopped
+        :rtype: str|None
+        """
+        if self.process.stdout.closed: return self.error
+        if self.timer: self.timer.cancel()
+        stopped = not self.exhausted and self.process.poll() is None
+        if stopped: self.process.kill()
+        self.process.stdout.close()
+        error = self.process.stderr.read()
+        exit_code = self.process.wait()
+        self.spent += time.time() - self.started
+        record(self.package.location, self.args, self.started, 'stopped' if stopped else exit_code)
+        if self.timed_out: return 'Timed out after %ss' % self.timeout
+        return error if exit_code and not stopped else None
+
+
+def merge_logs(packages, targets, n=None, since=None, jobs=None, get_timeout=None):
+    """
+    k-way merge of the logs of every package by commit date, newest first. Each package reads
+    at most n commits, and every git process still running once n commits were merged is stopped.
+    With more packages than jobs, the first chunk of every log is read up-front by at most jobs
+    git processes at once, instead of keeping a git process (and its pipes) open per package
+    during the whole merge, and the next chunks one at a time as the merge needs them.
+    The logs are in `git log --date-order`, which shows parents after their children even when
+    committed later, so the timeline is only ordered by commit date as far as the histories are.
+    :param list(Package) packages:
+    :param list(str) targets: Revision to log of every package
+    :param int n: Max commits of the whole timeline
+    :param str since:
+    :param int jobs: Max git processes running at once, no limit when None
+    :param callable get_timeout: Seconds git may run on a package, 0 for no limit
+    :return: Generator of (timestamp, package name, sha, author, subject), and the streams to
+        close once it is consumed
+    :rtype: (generator, list(LogStream))
+    """
+    get_timeout = get_timeout or (lambda package: 0)
+    streams = [LogStream(package, target, n, since, get_timeout(package)) for package, target in zip(packages, targets)]
+    if jobs and len(streams) > jobs: thread_map(LogStream.buffer, streams, jobs)
+    else:
+        for stream in streams: stream.start()
+
+    def timeline():
+        for count, (timestamp, name, sha, author, subject) in enumerate(heapq.merge(*streams)):
+            if n and count >= n: return
+            yield -timestamp, name, sha, author, subject
+    return timeline(), streams
+
+
+def format_entry(entry, width=0):
+    """
+    :param (int, str, str, str, str) entry: Timestamp, package name, sha, author and subject
+    :param int width: Package names are padded to it
+    :rtype: str
+    """
+    timestamp, name, sha, author, subject = entry
+    date = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
+    return '%s %s %s %s %s' % (Color.green(date), Color.build(name.ljust(width), Color._BLUE),
+                               Color.yellow(sha), subject, Color.build('<%s>' % author, Color._BOLD))
+
@@ -1,42 +1,109 @@
-import traceback
-from os import path, listdir
+import json
+import sys
 import time
+import traceback
+from os import path
+from Queue import Queue, Empty
 import inspect
 
 from git import GitCommandError
 
-from helpers import Color
+from multiprocessing import cpu_count
+
+from helpers import Color, thread_map, create_pool, interrupt_workers
 from .package import Package
+from .fetch_cache import FetchCache
+from .discovery import discover_repositories, get_ignore_patterns
+from .state_index import StateIndex
+from .planner import sync_commands, plan_package, format_plans, SyncPlan, INVALID
+from .runner import format_results, cancel, is_cancelled, init_worker, PASSED, TIMEOUT, CANCELLED
+from .fetcher import format_fetch_results
+from . import profiler
+from . import deadline
+from .daemon import WorkspaceDaemon, DaemonState, query_daemon
+from .command import parse_command_line, CommandPlan
+from .result import PackageResult, write_json
+from .timeline import merge_logs, format_entry
+from .diffstat import format_diff_stats
+from .status import format_statuses
+from .grep import WorkspaceGrep
 from libs.args_parser import *
 
-pool_packages = set()
+DISCOVERY_WORKERS = 16
+THREAD_JOBS = 16
 
-def execute_package(package, git_cmd, git_args):
+def execute_package(package, command):
     """
     :param Package package:
-    :param str git_cmd:
-    :param list git_args:
-    :rtype str:
+    :param CommandPlan command:
+    :rtype: PackageResult
     """
+    started, error_type, status = time.time(), None, None
+    if is_cancelled(): return PackageResult.create(package, command.git_cmd, '', started, status=CANCELLED)
+    # Every git process of the package still running once the deadline passed is killed
+    timeout = command.get_timeout(package)
+    deadline.start(timeout, package.time_spent)
     try:
-        output = Workspace.run_cmd(package, git_cmd, git_args)
+        output = command.execute(package)
     except GitCommandError as e:
-        output = Color.red(e.stderr or e.stdout)
+        output, error_type = Color.red(e.stderr or e.stdout), 'GitCommandError'
     except ValueError as e:
-        output = Color.red(e.message)
+        output, error_type = Color.red(e.message), 'ValueError'
+    except KeyboardInterrupt:
+        # Serial executor, the command is interrupted in this very thread
+        cancel()
+        output, error_type = Color.yellow('Interrupted'), 'KeyboardInterrupt'
     except:
-        output = Color.red(traceback.format_exc())
-    return output
-
-def competed_package(package, output):
+        output, error_type = Color.red(traceback.format_exc()), sys.exc_info()[0].__name__
+    finally:
+        expired = deadline.is_expired()
+        deadline.clear()
+    # A command failing once its git processes were killed failed because of it
+    if error_type or getattr(output, 'status', PASSED) != PASSED:
+        if expired: status = TIMEOUT
+        elif is_cancelled(): status = CANCELLED
+    # Killed git processes do not say why they stopped
+    if status == TIMEOUT and error_type: output = '%s\n%s' % (Color.red('Timed out after %.1fs' % timeout), output)
+    profiler.record(package.location, 'mgit %s' % command.git_cmd, started, status or ('error' if error_type else 0))
+    return PackageResult.create(package, command.git_cmd, output, started, error_type, status)
+
+def select_package(package, state_index, all_packages, only_local_changes, only_no_prod, package_names):
     """
     :param Package package:
-    :param str output:
+    :param StateIndex state_index:
+    :param bool all_packages:
+    :param bool only_local_changes:
+    :param bool only_no_prod:
+    :param list(str) package_names:
+    :rtype: Package|None
+    """
+    if all_packages \
+            or (package_names and (package.get_name() in package_names
+                                   or path.basename(package.location) in package_names)) \
+            or (only_local_changes and state_index.has_local_changes(package)) \
+            or (only_no_prod and state_index.get_remote_branch(package) != package.get_prod_branch()):
+        return package
+    return None
+
+
+
+def disable_prompts():
+    """
+    A credential prompt would hold its package until it times out, git fails at once instead. The
+    "git.prompt" config keeps them. The ssh command is left alone, it may come from core.sshCommand.
     """
-    pool_packages.remove(package.get_name())
-    Workspace._print_cmd_output(package, output)
+    if environ.get('git.prompt') == 'True': return
+    environ.setdefault('GIT_TERMINAL_PROMPT', '0')
 
 
+def get_repository_name(url):
+    """
+    :param str url: e.g. git@github.com:ggarri/mgit.git, https://host/mgit or /srv/git/mgit.git
+    :rtype: str
+    """
+    name = url.rstrip('/').replace(':', '/').split('/')[-1]
+    return name[:-len('.git')] if name.endswith('.git') else name
+
 
 class Workspace(object):
     """
@@ -47,258 +114,445 @@ class Workspace(object):
     pool = None
     packages = dict()
     git_cmd = None
-    git_args = []
+    command = None
     parser = None
+    plan_only = False
+    stream = False
+    output_format = 'text'
+    jobs = None
+    profile = None
 
-    def __init__(self, cwd, pool = None):
-        parser = AppArgsParser.create()
-        args, self.git_args = parser.parse_known_args()
-        if not args.git_cmd: parser.print_help(); return
+    def __init__(self, cwd, pool = None, manifest = None, args = None, command = None):
+        """
+        :param str cwd:
+        :param multiprocessing.Pool pool: Defaults to the one given by --executor or the config
+        :param Manifest manifest: Declared workspace packages, the workspace is scanned otherwise
+        :param argparse.Namespace args: Parsed AppArgsParser arguments, taken from sys.argv otherwise
+        :param CommandPlan command: Compiled git command, compiled from sys.argv otherwise
+        """
+        if args is None: args, command = parse_command_line()
 
         self.git_cmd = args.git_cmd
+        self.command = command
+        self.plan_only = args.plan
+        self.stream = args.stream
+        self.output_format = args.format
+        self.jobs = args.jobs
         self.workspace = args.ws or cwd
-        self.pool = pool
-        self.packages = Workspace.get_packages(
-            self.workspace,
-            all_packages=args.all_packages,
-            only_local_changes = args.only_local,
-            only_no_prod = args.no_prod,
-            package_names = (args.packages or list())
-        )
+        disable_prompts()
+        # Enabled before discovery and before pool workers are forked, so both are traced
+        profile_folder = profiler.enable() if args.profile or args.profile_output else None
+        if self.git_cmd == 'clone':
+            self.packages, urls = Workspace.get_clone_packages(self.workspace, command.argument, manifest,
+                                                               args.groups, args.packages)
+            self.command = CommandPlan(command.git_cmd, command.flags, argument=urls, timeout=command.timeout)
+        else:
+            self.packages = Workspace.get_packages(
+                self.workspace,
+                all_packages=args.all_packages,
+                only_local_changes = args.only_local,
+                only_no_prod = args.no_prod,
+                package_names = (args.packages or list()),
+                max_depth = args.depth,
+                manifest = manifest,
+                groups = args.groups
+            )
+        if profile_folder:
+            names = dict((path.realpath(package.location), package.get_name()) for package in self.packages)
+            self.profile = (profile_folder, names, args.profile_output, args.profile_format)
+        self.pool = pool or Workspace.get_pool(args.executor, args.jobs)
+
+    @staticmethod
+    def get_pool(executor, jobs):
+        """
+        CLI flags take precedence over the "executor"/"n_jobs" config. Without either, a process
+        pool is used when "n_cpu" is a number, as before.
+        :param str executor:
+        :param int jobs:
+        :rtype: multiprocessing.Pool|None
+        """
+        n_cpu = environ.get('n_cpu', '')
+        executor = executor or environ.get('executor') or ('process' if n_cpu.isdigit() else 'serial')
+        if executor == 'thread': jobs = jobs or int(environ.get('n_jobs', THREAD_JOBS))
+        elif executor == 'process': jobs = jobs or (int(n_cpu) if n_cpu.isdigit() else cpu_count())
+        return create_pool(executor, jobs, init_worker)
 
     def run(self):
+        try:
+            self._run()
+        finally:
+            if self.profile: self._print_profile()
+
+    def _run(self):
         """
         :param str git_cmd:
         :rtype list(str)
         """
+        if len(self.packages) == 0 and self.git_cmd == 'clone':
+            print(Color.green('Every package is already cloned'))
+            return
         if len(self.packages) == 0:
             print(Color.red('There is not packages selected'))
             exit(-1)
 
-        global pool_packages
-        print(Color.yellow('Following command "git %s" is about to run on:\n' % self.git_cmd))
-        for package in self.packages: print("\t" + package.get_name())
-        # raw_input(Color.green('\n\nPress Enter to continue...'))
+        if self.git_cmd == 'daemon': return self.run_daemon()
+        if self.git_cmd == 'log' and 'timeline' in self.command.flags: return self.run_timeline()
+        if self.git_cmd == 'grep': return self.run_grep()
+
+        plans, results, text = None, [], self.output_format == 'text'
+        if self.git_cmd in sync_commands:
+            plans = self.plan()
+            if text: print(format_plans(plans) + "\n")
+            if self.plan_only: return self._print_summary([], plans)
+            # Packages which timed out or were cancelled while planning are not run
+            results = [PackageResult.create(package, self.git_cmd, Color.red(plan.error or ''),
+                                            time.time() - package.time_spent, status=plan.state)
+                       for package, plan in zip(self.packages, plans) if plan.state in [TIMEOUT, CANCELLED]]
+            if is_cancelled(): return self._print_summary(results, plans)
+            self.packages = [package for package, plan in zip(self.packages, plans) if plan.needs_work()]
+            if len(self.packages) == 0:
+                if text and not results: print(Color.green('Every package is up-to-date'))
+                return self._print_summary(results, plans)
+        elif self.plan_only:
+            print(Color.red('--plan is only available for %s' % ', '.join(sync_commands)))
+            exit(-1)
 
+        if text:
+            print(Color.yellow('Following command "git %s" is about to run on:\n' % self.git_cmd))
+            for package in self.packages: print("\t" + package.get_name())
+        # raw_input(Color.green('\n\nPress Enter to continue...'))
+        # Every package is rendered from its result, nothing is printed along the way for json
+        print_result = Workspace._print_cmd_output if text else lambda result: None
+        if text and self.is_summary_only():
+            # Only the failures, the other packages are summarized in a single table
+            print_result = lambda result: result.status == PASSED or Workspace._print_cmd_output(result)
+        # Cancelled packages are only listed by the summary
+        print_output = lambda result: result.status == CANCELLED or print_result(result)
+
+        if not self.pool:
+            for package in self.packages:
+                try:
+                    result = execute_package(package, self.command)
+                    results.append(result)
+                    print_output(result)
+                except KeyboardInterrupt:
+                    cancel()
+            return self._print_summary(results, plans)
+
+        # Pool callbacks only enqueue results, every print happens in this thread
+        completed = Queue()
         for package in self.packages:
-            pool_packages.add(package.get_name())
-            if self.pool:
-                self.pool.apply_async(execute_package, [package, self.git_cmd, self.git_args],
-                                      callback=lambda output, package=package: competed_package(package, output))
-            else:
-                output = execute_package(package, self.git_cmd, self.git_args)
-                competed_package(package, output)
-
-        if not self.pool: return
-
+            self.pool.apply_async(execute_package, [package, self.command], callback=completed.put)
+
+        running = [package.get_name() for package in self.packages]
+        # Streamed lines would be mixed up with the progress line
+        print_progress = Workspace._print_progress if not self.stream and text else lambda *args: None
+        print_progress(running, len(self.packages))
+        interrupted = False
+        while len(running):
+            try:
+                try:
+                    # A timeout keeps the wait interruptible by Ctrl-C; results still wake it up immediately
+                    result = completed.get(timeout=0.5)
+                except Empty: continue
+                running.remove(result.name)
+                results.append(result)
+                print_progress(None)
+                print_output(result)
+                if len(running): print_progress(running, len(self.packages))
+            except KeyboardInterrupt:
+                print_progress(None)
+                if interrupted: break
+                interrupted = True
+                if text: print(Color.yellow('Interrupted, cancelling %d packages. Ctrl-C again to stop waiting for them'
+                                            % len(running)))
+                self.cancel()
+
+        # Stopped waiting on a second Ctrl-C, the packages left are reported as cancelled
+        if len(running): self.pool.terminate()
+        else: self.pool.close()
+        self.pool.join()
+        results += [PackageResult.create(package, self.git_cmd, '', time.time(), status=CANCELLED)
+                    for package in self.packages if package.get_name() in running]
+        self._print_summary(results, plans)
+
+    def cancel(self):
+        """
+        Kills the git processes running on every package and skips the packages not started yet.
+        Results of the completed packages are kept.
+        """
+        cancel()
+        if self.pool: interrupt_workers(self.pool)
+
+    def is_summary_only(self):
+        """
+        Whether the results are rendered as a single table instead of an output block per package
+        :rtype: bool
+        """
+        return (self.git_cmd == 'diff' and 'numstat' in self.command.flags) \
+            or (self.git_cmd == 'status' and 'short' in self.command.flags)
+
+    def _print_profile(self):
+        folder, names, output, output_format = self.profile
+        events = profiler.collect(folder)
+        # Keeps stdout a single parseable document with --format json
+        out = sys.stdout if self.output_format == 'text' else sys.stderr
+        out.write(profiler.format_report(events, names) + '\n')
+        if output:
+            profiler.write_trace(events, names, output, output_format)
+            out.write(Color.green('Profile written to %s' % output) + '\n')
+
+    def _print_summary(self, results, plans=None):
+        """
+        :param list(PackageResult) results: Every completed package
+        :param list(SyncPlan) plans:
+        """
+        if self.output_format == 'json': write_json(self.git_cmd, results, plans)
+        if not results: return
+        if self.output_format == 'text':
+            if self.is_summary_only():
+                print(format_diff_stats(results) if self.git_cmd == 'diff' else format_statuses(results))
+            elif self.git_cmd == 'bash': print(format_results(results))
+            elif self.git_cmd in ['fetch', 'clone']:
+                print(format_fetch_results(results, 'cloned' if self.git_cmd == 'clone' else 'fetched'))
+            if self.git_cmd != 'bash':
+                for status, label, color in [(TIMEOUT, 'Timed out', Color.red), (CANCELLED, 'Cancelled', Color.yellow)]:
+                    names = sorted(result.name for result in results if result.status == status)
+                    if names: print(color('%s: %s' % (label, ', '.join(names))))
+        # Failures of other commands are only reported, as before
+        failed = [result for result in results if result.status != PASSED
+                  and (result.status in [TIMEOUT, CANCELLED] or self.git_cmd in ['bash', 'fetch', 'clone'])]
+        if len(failed):
+            exit(1)
+
+    def run_daemon(self):
+        """
+        mgit daemon [start|stop|status]
+        """
+        action = self.command.argument
+        if action == 'start':
+            try:
+                WorkspaceDaemon(self.workspace, self.packages).serve()
+            except ValueError as e:
+                print(Color.red(e.message))
+                exit(-1)
+            return
+
+        response = query_daemon(self.workspace, 'stop' if action == 'stop' else 'state')
+        if response is None:
+            print(Color.yellow('No daemon running on %s' % self.workspace))
+        elif action == 'stop':
+            print(Color.green('Daemon stopped'))
+        else:
+            state = response['packages']
+            for package in self.packages:
+                entry = state.get(path.realpath(package.location))
+                if not entry: line = Color.yellow('pending')
+                elif 'error' in entry: line = Color.red(entry['error'].strip().split('\n')[-1])
+                else:
+                    line = '%s%s%s%s' % (entry['branch'] or 'detached', Color.yellow(' dirty') if entry['dirty'] else '',
+                                         '' if entry['ahead'] is None else ' +%d -%d' % (entry['ahead'], entry['behind']),
+                                         '' if entry.get('watched', True) else Color.yellow(' (not watched)'))
+                print('%s  %s' % (package.get_name(), line))
+
+    def run_timeline(self):
+        """
+        mgit log --timeline: the -n most recent commits across every package, merged by commit date
+        """
+        command = self.command
+        target = '%s/%s' % (command.remote, command.branch) if command.remote else command.branch or 'HEAD'
+        entries, streams = merge_logs(self.packages, [target] * len(self.packages), command.flags.get('-n'),
+                                      command.flags.get('since'), self.jobs or int(environ.get('n_jobs', THREAD_JOBS)),
+                                      command.get_timeout)
+        width = max(len(package.get_name()) for package in self.packages)
+        timeline = []
         try:
-            while len(pool_packages):
-                print "Waiting packages: %s" % str(pool_packages)
-                time.sleep(1)
-        except KeyboardInterrupt: terminate = True; print "Interrupt!!!"
-        else: terminate = False;
-
-        if terminate: self.pool.terminate()
-        print "Waiting threads to complete"; self.pool.close()
-        print "Waiting threads to wrap-up"; self.pool.join()
-
-    @staticmethod
-    def run_cmd(package, git_cmd, flags):
-        """
-        :param package: Package
-        :param git_cmd: str
-        :param flags: str
-        :rtype: str
-        """
-        if git_cmd == 'log': return Workspace.run_cmd_log(package, flags)
-        if git_cmd == 'pull': return Workspace.run_cmd_pull(package, flags)
-        if git_cmd == 'status': return Workspace.run_cmd_status(package, flags)
-        if git_cmd == 'diff': return Workspace.run_cmd_diff(package, flags)
-        if git_cmd == 'push': return Workspace.run_cmd_push(package, flags)
-        if git_cmd == 'commit': return Workspace.run_cmd_commit(package, flags)
-        if git_cmd == 'checkout': return Workspace.run_cmd_checkout(package, flags)
-        if git_cmd == 'clean': return Workspace.run_cmd_clean(package, flags)
-        if git_cmd == 'bash': return Workspace.run_cmd_bash(package, flags)
-        if git_cmd == 'reset': return Workspace.run_cmd_reset(package, flags)
-        if git_cmd == 'merge': return Workspace.run_cmd_merge(package, flags)
-        else: raise ValueError('Invalid argument "git %s" is not implemented or does not exists' % git_cmd)
-
-    @staticmethod
-    def run_cmd_log(package, flags):
-        """
-        :param package: Package
-        :param flags: list(str)
-        :rtype: str
-        """
-        args, remote_branch = Workspace._get_cmd_args(GitLogParser.create(), flags)
-        return package.cmd_log(args, remote_branch[0], remote_branch[1])
-
-    @staticmethod
-    def run_cmd_status(package, flags):
-        """
-        :param package: Package
-        :param flags: list(str)
-        :rtype: str
-        """
-        args, unknown = Workspace._get_cmd_args(GitStatusParser.create(), flags)
-        return package.cmd_status(args)
-
-    @staticmethod
-    def run_cmd_diff(package, flags):
-        """
-        :param package: Package
-        :param flags: list(str)
-        :rtype: str
-        """
-        args, remote_branch = Workspace._get_cmd_args(GitDiffParser.create(), flags)
-        return package.cmd_diff(args, remote_branch[0], remote_branch[1])
-
-    @staticmethod
-    def run_cmd_pull(package, flags):
-        """
-        :param package: Package
-        :param flags: list(str)
-        :rtype: str
-        """
-        args, remote_branch = Workspace._get_cmd_args(GitPullParser.create(), flags)
-        return package.cmd_pull(args, remote_branch[0], remote_branch[1])
-
-    @staticmethod
-    def run_cmd_merge(package, flags):
-        """
-        :param package: Package
-        :param flags: list(str)
-        :rtype: str
-        """
-        args, remote_branch = Workspace._get_cmd_args(GitMergeParser.create(), flags)
-        return package.cmd_merge(remote_branch[0], remote_branch[1])
+            for entry in entries:
+                if self.output_format == 'text': print(format_entry(entry, width))
+                else: timeline.append(dict(zip(['timestamp', 'package', 'sha', 'author', 'subject'], entry)))
+        finally:
+            errors = [(stream.package.get_name(), stream.close()) for stream in streams]
+        errors = dict((name, error.strip()) for name, error in errors if error)
+        if self.output_format == 'json':
+            json.dump({'command': 'log', 'timeline': timeline, 'errors': errors}, sys.stdout, indent=2, sort_keys=True)
+            print('')
+        else:
+            for name in sorted(errors): print(Color.red('%s: %s' % (name, errors[name])))
 
-    @staticmethod
-    def run_cmd_push(package, flags):
+    def run_grep(self):
         """
-        :param package: Package
-        :param flags: list(str)
-        :rtype: str
+        mgit grep: matches are written as they are found, until --max-matches is reached
         """
-        args, remote_branch = Workspace._get_cmd_args(GitPushParser.create(), flags)
-        return package.cmd_push(args, remote_branch[0], remote_branch[1])
+        text = self.output_format == 'text'
+        grep = WorkspaceGrep(self.command.argument, self.command.flags.get('max_matches', 0), collect=not text,
+                             get_timeout=self.command.get_timeout)
+        interrupted = False
+        try:
+            grep.run(self.packages, self.jobs or int(environ.get('n_jobs', THREAD_JOBS)))
+        except KeyboardInterrupt:
+            interrupted = True
+            grep.cancel()
+            if text: print(Color.yellow('Interrupted'))
+        if not text:
+            json.dump({'command': 'grep', 'errors': grep.errors, 'cancelled': sorted(grep.cancelled),
+                       'truncated': sorted(grep.truncated), 'timed_out': sorted(grep.timed_out),
+                       'matches': [{'package': name, 'match': line} for name, line in grep.matches]},
+                      sys.stdout, indent=2, sort_keys=True)
+            sys.stdout.write('\n')
+            if grep.errors or grep.timed_out: exit(1)
+            return
+        summary = '%d matches in %d packages' % (grep.n_matches, len([n for n in grep.counts.values() if n]))
+        if grep.truncated: summary += ', %d packages truncated' % len(grep.truncated)
+        if grep.cancelled: summary += ', %d packages cancelled' % len(grep.cancelled)
+        if grep.truncated or grep.cancelled:
+            summary += ' by %s' % ('Ctrl-C' if interrupted else '--max-matches')
+        if grep.timed_out: summary += ', %d packages timed out' % len(grep.timed_out)
+        print(Color.yellow(summary))
+        if grep.timed_out: print(Color.red('Timed out: %s' % ', '.join(sorted(grep.timed_out))))
+        for name in sorted(grep.errors): print(Color.red('%s: %s' % (name, grep.errors[name])))
+        if grep.errors or grep.timed_out: exit(1)
+
+    def plan(self):
+        """
+        Computes ahead/behind and the resulting sync state of every selected package
+        :rtype: list(SyncPlan)
+        """
+        command, plans = self.command, dict()
+
+        def plan(package):
+            # Planning fetches the remote, it is part of the time the package has
+            started, timeout = time.time(), command.get_timeout(package)
+            deadline.start(timeout)
+            try:
+                sync_plan = plan_package(package, command.git_cmd, command.flags, command.remote, command.branch)
+                if sync_plan.state == INVALID and deadline.is_expired():
+                    sync_plan.state, sync_plan.error = TIMEOUT, 'Timed out after %.1fs while planning' % timeout
+            finally:
+                deadline.clear()
+            package.time_spent = time.time() - started
+            plans[package.location] = sync_plan
 
-    @staticmethod
-    def run_cmd_commit(package, flags):
-        """
-        :param package: Package
-        :param flags: list(str)
-        :rtype: str
-        """
-        args, message = Workspace._get_cmd_args(GitCommitParser.create(), flags)
-        message = ' '.join(message) if message else None
-        if message and (message[0] == '\'' or message[0] == '\''): message = message[1:]
-        if message and (message[-1] == '\'' or message[-1] == '\''): message = message[:-1]
-        return package.cmd_commit(args, message)
+        try:
+            thread_map(plan, self.packages, int(environ.get('discovery.workers', DISCOVERY_WORKERS)))
+        except KeyboardInterrupt:
+            if self.output_format == 'text': print(Color.yellow('Interrupted, cancelling the packages not planned yet'))
+            self.cancel()
+        return [plans.get(package.location) or SyncPlan(package.get_name(), state=CANCELLED)
+                for package in self.packages]
 
     @staticmethod
-    def run_cmd_bash(package, flags):
+    def _print_cmd_output(result):
         """
-        :param package: Package
-        :param flags: list(str)
-        :rtype: str
+        :param PackageResult result:
         """
-        bash_cmd = Workspace._get_cmd_args(GitBashParser.create(), flags)
-        return package.cmd_bash(bash_cmd)
+        print(inspect.cleandoc("""
+        ############################
+        # %s (%s)
+        ############################
+        % s
+        """)) % (result.name, result.branch or 'detached', result.output)
+        print("\n")
 
     @staticmethod
-    def run_cmd_checkout(package, flags):
+    def _print_progress(running, total=None):
         """
-        :param package: Package
-        :param flags: list(str)
-        :rtype: str
+        Keeps a single status line with the packages still running, or clears it when running is None
+        :param list(str) running:
+        :param int total:
         """
-        parser = GitCheckoutParser.create()
-        args, remote_branch = Workspace._get_cmd_args(parser, flags)
-        if '-b' in args:
-            remote_name, branch_name = remote_branch[0], remote_branch[1]
-            _from = ('%s/%s'%(remote_name, branch_name)) if remote_name else branch_name
-            return package.cmd_checkout(args, branch_name=args['-b'], from_branch=_from)
+        if not sys.stdout.isatty(): return
+        if running is None: line = ''
         else:
-            return package.cmd_checkout(args, branch_name=remote_branch[1])
-
-    @staticmethod
-    def run_cmd_clean(package, flags):
-        """
-        :param package: Package
-        :param flags: list(str)
-        :rtype: str
-        """
-        parser = GitCheckoutParser.create()
-        args, remote_branch = Workspace._get_cmd_args(parser, flags)
-        return package.cmd_clean(remote_branch[0], remote_branch[1])
+            line = '[%d/%d] Running: %s' % (total - len(running), total, ', '.join(running))
+            width = int(environ.get('COLUMNS', 80)) - 1
+            if len(line) > width: line = line[:width - 3] + '...'
+        sys.stdout.write('\r\033[K' + line)
+        sys.stdout.flush()
 
     @staticmethod
-    def run_cmd_reset(package, flags):
-        """
-        :param package: Package
-        :param flags: list(str)
-        :rtype: str
-        """
-        parser = GitResetParser.create()
-        args, remote_branch = Workspace._get_cmd_args(parser, flags)
-        return package.cmd_reset(args, remote_branch[0], remote_branch[1])
-
-    @staticmethod
-    def _get_cmd_args(parser, flags):
-        """
-        :param parser: ArgumentParser
-        :param flags: str
-        :rtype: dict
-        """
-        args, unknown = parser.parse_known_args(flags)
-        filter_args = dict((k, v) for k, v in vars(args).iteritems() if v)
-
-        if isinstance(parser, GitBashParser):
-            return unknown[0]
-        if isinstance(parser, GitCommitParser) or isinstance(parser, GitStatusParser):
-            return filter_args, unknown
+    def get_clone_packages(src, urls, manifest=None, groups=None, package_names=None):
+        """
+        Packages to clone, each into `<src>/<repository name>`, or from the manifest urls into their
+        manifest path when no url is given. Folders which already exist are skipped.
+        :param str src: Workspace folder
+        :param list(str) urls:
+        :param Manifest manifest:
+        :param list(str) groups: Only clone the manifest packages of these groups
+        :param list(str) package_names: Only clone these manifest packages
+        :return: Packages not cloned yet, and the url of each by package name
+        :rtype: (list(Package), dict)
+        """
+        if urls:
+            targets = [(path.join(src, get_repository_name(url)), get_repository_name(url), url) for url in urls]
+        elif manifest:
+            try:
+                package_names = list(package_names or []) + manifest.get_group_packages(groups or [])
+            except ValueError as e:
+                print(Color.red(e.message))
+                exit(-1)
+            targets = [target for target in manifest.get_urls(src)
+                       if not package_names or target[1] in package_names]
+        else:
+            print(Color.red('Nothing to clone, give the urls, --from-file or a manifest with urls'))
+            exit(-1)
 
-        remote, branch = None, None
-        if len(unknown) >= 2: remote, branch = unknown[0], unknown[1]
-        elif len(unknown) >= 1:
-            if '/' in unknown[0]: remote, branch = unknown[0].split('/')[0], unknown[0].split('/')[1]
-            else: branch = unknown[0]
-        return filter_args, [remote, branch]
+        fetch_cache, packages, clone_urls = FetchCache(src), [], dict()
+        for location, name, url in targets:
+            if name in clone_urls: print(Color.red('"%s" is cloned twice into %s' % (url, location))); exit(-1)
+            if path.exists(location):
+                print(Color.yellow('Skipping %s, %s already exists' % (name, location)))
+                continue
+            timeout = manifest.get_timeout(name) if manifest else None
+            packages.append(Package(location, fetch_cache, name, timeout=timeout))
+            clone_urls[name] = url
+        return packages, clone_urls
 
     @staticmethod
-    def _print_cmd_output(package, output):
-        """
-        :param Package package:
-        :param str output:
-        :return:
-        """
-        cur_remote, cur_branch = package.get_cur_remote_branch()
-        print(inspect.cleandoc("""
-        ############################
-        # %s (%s)
-        ############################
-        % s
-        """)) % (package.name, cur_branch, output)
-        print("\n")
-
-    @staticmethod
-    def get_packages(src, all_packages, only_local_changes, only_no_prod, package_names):
+    def get_packages(src, all_packages, only_local_changes, only_no_prod, package_names, max_depth=None,
+                     manifest=None, groups=None):
         """
         :param string src: Source path
         :param bool only_local_changes:
         :param book only_no_prod:
         :param list(string) packages:
+        :param int max_depth: How many folders deep repositories are searched for (discovery.depth)
+        :param Manifest manifest: Packages are taken from it instead of scanning src
+        :param list(str) groups: Manifest groups whose packages are selected
         :return:
         """
-        folders = [path.join(src, f) for f in listdir(path.join(src)) if not path.isfile(path.join(src, f))]
-        packages = [Package(pf) for pf in folders if path.isdir(path.join(pf, '.git'))]
-        if len(packages) == 0:
-            print(Color.red('Empty workspace. None found `./*/.git` folders'))
-            exit(-1)
-
-        return [package for package in packages
-                if all_packages
-                or (only_local_changes and package._has_local_changes())
-                or (packages and package.get_name() in package_names)
-                or (only_no_prod and package.get_cur_remote_branch(True) != environ['prod_branch'])]
+        workers = int(environ.get('discovery.workers', DISCOVERY_WORKERS))
+        fetch_cache, state_index = FetchCache(src), StateIndex(src)
+        if manifest:
+            try:
+                package_names = list(package_names) + manifest.get_group_packages(groups or [])
+            except ValueError as e:
+                print(Color.red(e.message))
+                exit(-1)
+            packages = []
+            for location, name, remote, branch in manifest.get_locations(src):
+                if path.isdir(location):
+                    packages.append(Package(location, fetch_cache, name, remote, branch, manifest.get_timeout(name)))
+                else: print(Color.yellow('Package "%s" not found at %s' % (name, location)))
+        else:
+            if groups:
+                print(Color.red('--group requires a manifest (config/manifest.yml)'))
+                exit(-1)
+            max_depth = max_depth or int(environ.get('discovery.depth', 1))
+            folders = discover_repositories(src, max_depth, get_ignore_patterns(src), workers)
+            if len(folders) == 0:
+                print(Color.red('Empty workspace. None found `%s/.git` folders' % '/'.join(['*'] * max_depth)))
+                exit(-1)
+            packages = [Package(pf, fetch_cache, name=path.relpath(pf, src)) for pf in folders]
+
+        # A running daemon already knows the state of every package
+        daemon_state = query_daemon(src, 'state') if only_local_changes or only_no_prod else None
+        if daemon_state: state_index = DaemonState(daemon_state['packages'], state_index)
+
+        # Opening repos and evaluating filters is I/O bound (git subprocesses), so a bounded
+        # thread pool returns the selection in about the time of the slowest repository
+        selected = thread_map(
+            lambda package: select_package(package, state_index,
+                                           all_packages, only_local_changes, only_no_prod, package_names),
+            packages, workers)
+        state_index.save()
+        return [package for package in selected if package]
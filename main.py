@@ -1,23 +1,35 @@
 #!/usr/bin/env python2.7
 
 import yaml
-from libs.helpers import LoggingPool
 from os import path, environ, getcwd
 
-from libs.workspace import Workspace
-
 CUR_DIR = path.dirname(path.realpath(__file__))
 
+# Loaded before the arguments are parsed, --version and the help text read it
 with open(path.join(CUR_DIR, "config/environment.yml"), 'r') as stream:
     try:
-        custom_env = yaml.load(stream)
+        custom_env = yaml.safe_load(stream) or dict()
         for key, value in custom_env.items():
             environ[key] = str(value)
     except yaml.YAMLError as exc:
         print(exc)
 
 if __name__ == "__main__":
-    pool = LoggingPool(processes=int(environ['n_cpu'])) \
-        if 'n_cpu' in environ and environ['n_cpu'].isdigit() else None
-    ws = Workspace(cwd=path.join(CUR_DIR, getcwd()), pool=pool)
-    ws.run()
\ No newline at end of file
+    from libs.command import parse_command_line
+
+    # Arguments are validated before GitPython and the workspace modules are imported,
+    # so --help and invalid arguments answer right away
+    args, command = parse_command_line()
+
+    from libs.workspace import Workspace
+    from libs.manifest import Manifest
+    from libs.helpers import Color
+
+    manifest_file = path.join(CUR_DIR, "config/manifest.yml")
+    try:
+        manifest = Manifest.load(manifest_file)
+    except ValueError as e:
+        print(Color.red('Invalid manifest %s: %s' % (manifest_file, e)))
+        exit(-1)
+    ws = Workspace(cwd=path.join(CUR_DIR, getcwd()), manifest=manifest, args=args, command=command)
+    ws.run()
@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from os import path
+import sys
+
+MGIT_DIR = path.dirname(path.dirname(path.realpath(__file__)))
+sys.path.insert(0, MGIT_DIR)
+sys.path.insert(0, path.join(MGIT_DIR, 'benchmarks'))
+
+from generate_workspace import generate_workspace, git
+from libs import fetcher, deadline
+from libs.fetcher import HostSlot, get_host, get_received_bytes, format_bytes, is_transient, run_transfer, \
+    fetch_remote, clone_repository, LOCAL_HOST
+from libs.package import Package
+from libs.runner import PASSED, FAILED, TIMEOUT
+
+
+class ParsingTest(unittest.TestCase):
+    def test_get_host(self):
+        self.assertEqual(get_host('https://github.com/ggarri/mgit.git'), 'github.com')
+        self.assertEqual(get_host('ssh://git@github.com:22/ggarri/mgit.git'), 'github.com')
+        self.assertEqual(get_host('git@github.com:ggarri/mgit.git'), 'github.com')
+        self.assertEqual(get_host('file:///srv/git/mgit.git'), LOCAL_HOST)
+        self.assertEqual(get_host('/srv/git/mgit.git'), LOCAL_HOST)
+        self.assertEqual(get_host('../mgit'), LOCAL_HOST)
+        self.assertEqual(get_host(None), LOCAL_HOST)
+
+    def test_get_received_bytes(self):
+        output = 'remote: Counting objects: 5, done.\n' \
+                 'Receiving objects:  50% (2/4), 1.00 KiB | 0 bytes/s\r' \
+                 'Receiving objects: 100% (4/4), 2.50 MiB | 1.2 MiB/s, done.\n'
+        self.assertEqual(get_received_bytes(output), int(2.5 * 1024 ** 2))
+        self.assertEqual(get_received_bytes('Receiving objects: 100% (3/3), 254 bytes | 0 bytes/s, done.'), 254)
+        self.assertEqual(get_received_bytes('Already up to date.'), 0)
+        self.assertEqual(get_received_bytes(None), 0)
+
+    def test_format_bytes(self):
+        self.assertEqual(format_bytes(512), '512 bytes')
+        self.assertEqual(format_bytes(1536), '1.5 KiB')
+        self.assertEqual(format_bytes(3 * 1024 ** 3), '3.0 GiB')
+
+    def test_is_transient(self):
+        self.assertTrue(is_transient('fatal: unable to access \'https://host/\': Could not resolve host: host'))
+        self.assertFalse(is_transient("fatal: 'origin' does not appear to be a git repository"))
+
+
+class HostSlotTest(unittest.TestCase):
+    def setUp(self):
+        self.locks_folder, fetcher.LOCKS_FOLDER = fetcher.LOCKS_FOLDER, tempfile.mkdtemp(prefix='mgit-locks-')
+
+    def tearDown(self):
+        shutil.rmtree(fetcher.LOCKS_FOLDER)
+        fetcher.LOCKS_FOLDER = self.locks_folder
+        deadline.clear()
+
+    def test_limit(self):
+        with HostSlot('host', 1) as first:
+            self.assertTrue(first.granted)
+            acquired = []
+            waiting = threading.Thread(target=lambda: acquired.append(HostSlot('host', 1).__enter__()))
+            waiting.start()
+            waiting.join(0.3)
+            self.assertEqual(acquired, [])
+            # Other hosts have their own slots
+            with HostSlot('other', 1) as other: self.assertTrue(other.granted)
+        waiting.join(2)
+        self.assertTrue(acquired[0].granted)
+        acquired[0].__exit__()
+
+    def test_locks_folder_is_private(self):
+        fetcher.LOCKS_FOLDER = path.join(fetcher.LOCKS_FOLDER, 'locks')
+        with HostSlot('host', 1) as slot: self.assertTrue(slot.granted)
+        self.assertEqual(os.stat(fetcher.LOCKS_FOLDER).st_mode & 0o777, 0o700)
+        fetcher.LOCKS_FOLDER = path.dirname(fetcher.LOCKS_FOLDER)
+
+    def test_refuses_locks_folder_of_another_user(self):
+        getuid, os.getuid = os.getuid, lambda: getuid() + 1
+        try:
+            self.assertRaises(ValueError, HostSlot('host', 1).__enter__)
+        finally:
+            os.getuid = getuid
+
+    def test_stops_waiting_once_the_deadline_passed(self):
+        with HostSlot('host', 1):
+            deadline.start(0.1)
+            with HostSlot('host', 1) as slot: self.assertFalse(slot.granted)
+
+
+class TransferTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='mgit-fetch-')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        deadline.clear()
+
+    def test_retries_transient_errors(self):
+        args = ['sh', '-c', 'echo "fatal: Connection refused" >&2; exit 128']
+        result, attempts = run_transfer(args, self.root, 'host', retries=2, backoff=0)
+        self.assertEqual((result.status, attempts), (FAILED, 3))
+
+    def test_does_not_retry_other_errors(self):
+        args = ['sh', '-c', 'echo "fatal: repository not found" >&2; exit 128']
+        result, attempts = run_transfer(args, self.root, 'host', retries=2, backoff=0)
+        self.assertEqual((result.status, attempts), (FAILED, 1))
+
+    def test_times_out_with_the_package_deadline(self):
+        deadline.start(0.3)
+        result, attempts = run_transfer(['sleep', '5'], self.root, 'host', retries=2, backoff=0)
+        self.assertEqual((result.status, attempts), (TIMEOUT, 1))
+
+    def test_fetch_and_clone_local_bare_repository(self):
+        workspace = generate_workspace(self.root, 1, depth=3, branches=0)
+        repo, remote = path.join(workspace, 'repo-000'), path.join(self.root, 'remotes', 'repo-000.git')
+        # New commits on the remote
+        upstream = path.join(self.root, 'upstream')
+        git(self.root, 'clone', '-q', 'file://' + remote, upstream)
+        with open(path.join(upstream, 'new.txt'), 'w') as stream: stream.write('new\n' * 100)
+        git(upstream, 'add', '-A')
+        git(upstream, 'commit', '-q', '-m', 'new')
+        git(upstream, 'push', '-q', 'origin', 'master')
+
+        fetch = fetch_remote(Package(repo), 'origin', {'prune': True})
+        self.assertEqual(fetch.status, PASSED)
+        self.assertEqual(fetch.attempts, 1)
+        self.assertGreater(fetch.n_bytes, 0)
+        self.assertEqual(fetch_remote(Package(repo), 'origin', {}).n_bytes, 0)
+
+        clone = clone_repository('file://' + remote, path.join(self.root, 'clones', 'repo-000'))
+        self.assertEqual(clone.status, PASSED)
+        self.assertTrue(path.isdir(path.join(self.root, 'clones', 'repo-000', '.git')))
+        missing = clone_repository(path.join(self.root, 'remotes', 'missing.git'), path.join(self.root, 'clones', 'x'))
+        self.assertEqual(missing.status, FAILED)
+        self.assertEqual(missing.fetches[0].attempts, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import shutil
+import tempfile
+import unittest
+from os import path
+import sys
+
+MGIT_DIR = path.dirname(path.dirname(path.realpath(__file__)))
+sys.path.insert(0, MGIT_DIR)
+sys.path.insert(0, path.join(MGIT_DIR, 'benchmarks'))
+
+from generate_workspace import generate_workspace, git
+from libs.package import Package
+from libs.planner import plan_package, SyncPlan, UP_TO_DATE, FAST_FORWARD, NEEDS_REBASE, DIVERGED, NEW_BRANCH, \
+    FORCE, INVALID
+from libs.runner import TIMEOUT, CANCELLED
+
+
+class PlanPackageTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='mgit-planner-')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def create_package(self, behind=0, ahead=0, dirty=0):
+        """
+        :param int behind: Commits only in origin/master
+        :param int ahead: Commits only in the local master
+        :param int dirty: 1 to leave a modified file
+        :rtype: Package
+        """
+        workspace = generate_workspace(self.root, 1, depth=2, branches=0, dirty=dirty, behind=behind, ahead=ahead)
+        return Package(path.join(workspace, 'repo-000'))
+
+    def plan(self, package, git_cmd='pull', flags=None, remote=None, branch=None):
+        return plan_package(package, git_cmd, flags or dict(), remote, branch)
+
+    def test_up_to_date(self):
+        plan = self.plan(self.create_package())
+        self.assertEqual((plan.target, plan.ahead, plan.behind, plan.state), ('origin/master', 0, 0, UP_TO_DATE))
+        self.assertFalse(plan.needs_work())
+        self.assertEqual(self.plan(self.create_package(), 'push').state, UP_TO_DATE)
+
+    def test_behind(self):
+        package = self.create_package(behind=2)
+        plan = self.plan(package)
+        self.assertEqual((plan.ahead, plan.behind, plan.state), (0, 2, FAST_FORWARD))
+        self.assertTrue(plan.needs_work())
+        # Nothing to send
+        self.assertEqual(self.plan(package, 'push').state, UP_TO_DATE)
+
+    def test_ahead(self):
+        package = self.create_package(ahead=3)
+        plan = self.plan(package)
+        self.assertEqual((plan.ahead, plan.behind, plan.state), (3, 0, UP_TO_DATE))
+        self.assertEqual(self.plan(package, 'push').state, FAST_FORWARD)
+
+    def test_diverged(self):
+        package = self.create_package(behind=1, ahead=1)
+        self.assertEqual(self.plan(package).state, DIVERGED)
+        self.assertEqual(self.plan(package, flags={'rebase': True}).state, NEEDS_REBASE)
+        self.assertEqual(self.plan(package, 'push').state, DIVERGED)
+        self.assertEqual(self.plan(package, 'push', {'force': True}).state, FORCE)
+
+    def test_dirty_does_not_change_the_plan(self):
+        # Local changes are stashed by the pull itself
+        plan = self.plan(self.create_package(behind=1, dirty=1))
+        self.assertEqual((plan.behind, plan.state), (1, FAST_FORWARD))
+
+    def test_branch_without_upstream(self):
+        package = self.create_package()
+        git(package.location, 'checkout', '-q', '-b', 'feature')
+        plan = self.plan(package)
+        self.assertEqual((plan.state, plan.error), (INVALID, 'Branch "feature" does not exists'))
+        # Invalid plans still run, so the command reports the error
+        self.assertTrue(plan.needs_work())
+        plan = self.plan(package, 'push')
+        self.assertEqual((plan.target, plan.state), ('origin/feature', NEW_BRANCH))
+
+    def test_unknown_remote(self):
+        plan = self.plan(self.create_package(), remote='upstream', branch='master')
+        self.assertEqual((plan.state, plan.error), (INVALID, 'Remote "upstream" does not exists'))
+
+    def test_timed_out_and_cancelled_plans_do_not_run(self):
+        self.assertFalse(SyncPlan('package', state=TIMEOUT).needs_work())
+        self.assertFalse(SyncPlan('package', state=CANCELLED).needs_work())
+
+
+if __name__ == '__main__':
+    unittest.main()
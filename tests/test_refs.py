@@ -0,0 +1,128 @@
+import shutil
+import subprocess
+import tempfile
+import unittest
+from os import path, makedirs
+import sys
+
+MGIT_DIR = path.dirname(path.dirname(path.realpath(__file__)))
+sys.path.insert(0, MGIT_DIR)
+sys.path.insert(0, path.join(MGIT_DIR, 'benchmarks'))
+
+from generate_workspace import generate_workspace, commit_files, git, GIT_ENV
+from libs.refs import RefReader
+
+
+def git_output(cwd, *args):
+    """
+    :param str cwd:
+    :param list(str) args:
+    :rtype: str
+    """
+    return subprocess.check_output(['git'] + list(args), cwd=cwd, env=GIT_ENV).strip()
+
+
+class RefReaderTest(unittest.TestCase):
+    """
+    Everything RefReader reads is checked against git itself, on a repository whose refs are
+    partly packed (annotated tags included), partly loose, with a linked worktree
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp(prefix='mgit-refs-')
+        workspace = generate_workspace(cls.root, 1, depth=2, branches=2)
+        cls.repo = repo = path.join(workspace, 'repo-000')
+        git(repo, 'branch', 'nested/feature')
+        git(repo, 'tag', '-a', '-m', 'release', 'v1')
+        git(repo, 'remote', 'add', 'upstream', 'git@example.com:mgit/repo-000.git')
+        # Every ref so far only lives in packed-refs, then master moves on as a loose ref
+        git(repo, 'pack-refs', '--all', '--prune')
+        commit_files(repo, 'loose', 1)
+        git(repo, 'branch', 'loose-only')
+        git(repo, 'branch', '--set-upstream-to', 'origin/master', 'feature-0')
+        cls.worktree = path.join(cls.root, 'worktree')
+        git(repo, 'worktree', 'add', '-q', '-b', 'in-worktree', cls.worktree)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+
+    def assertResolves(self, reader, ref, cwd=None):
+        self.assertEqual(reader.resolve(ref), git_output(cwd or self.repo, 'rev-parse', ref))
+
+    def test_packed_refs(self):
+        self.assertEqual(RefReader._parse_packed_refs(open(path.join(self.repo, '.git', 'packed-refs')).read()).get(
+            'refs/heads/master'), git_output(self.repo, 'rev-parse', 'master~1'))
+        reader = RefReader(self.repo)
+        for ref in ['refs/heads/feature-1', 'refs/heads/nested/feature', 'refs/remotes/origin/master']:
+            self.assertFalse(path.isfile(path.join(self.repo, '.git', ref)))
+            self.assertResolves(reader, ref)
+            self.assertTrue(reader.has_ref(ref))
+        self.assertFalse(reader.has_ref('refs/heads/missing'))
+        self.assertIsNone(reader.resolve('refs/heads/missing'))
+
+    def test_peeled_annotated_tag(self):
+        # The tag object, not the commit of the "^" line following it in packed-refs
+        self.assertResolves(RefReader(self.repo), 'refs/tags/v1')
+
+    def test_loose_refs_win_over_packed_ones(self):
+        reader = RefReader(self.repo)
+        self.assertResolves(reader, 'refs/heads/master')
+        self.assertResolves(reader, 'refs/heads/loose-only')
+
+    def test_branches(self):
+        reader = RefReader(self.repo)
+        heads = git_output(self.repo, 'for-each-ref', '--format=%(refname)', 'refs/heads/').split('\n')
+        self.assertEqual(reader.get_branches(), sorted(ref[len('refs/heads/'):] for ref in heads))
+        remotes = git_output(self.repo, 'for-each-ref', '--format=%(refname)', 'refs/remotes/origin/').split('\n')
+        self.assertEqual(reader.get_remote_branches('origin'),
+                         sorted(ref[len('refs/remotes/origin/'):] for ref in remotes))
+
+    def test_head(self):
+        self.assertEqual(RefReader(self.repo).get_head(), ('master', git_output(self.repo, 'rev-parse', 'HEAD')))
+
+    def test_detached_head(self):
+        detached = path.join(self.root, 'detached')
+        git(self.root, 'clone', '-q', self.repo, detached)
+        git(detached, 'checkout', '-q', '--detach', 'HEAD~1')
+        self.assertEqual(RefReader(detached).get_head(), (None, git_output(detached, 'rev-parse', 'HEAD')))
+
+    def test_worktree_gitfile(self):
+        reader = RefReader(self.worktree)
+        self.assertTrue(path.isfile(path.join(self.worktree, '.git')))
+        self.assertEqual(reader.git_dir, path.realpath(git_output(self.worktree, 'rev-parse', '--absolute-git-dir')))
+        self.assertEqual(path.realpath(reader.common_dir),
+                         path.realpath(path.join(self.worktree, git_output(self.worktree, 'rev-parse',
+                                                                           '--git-common-dir'))))
+        self.assertEqual(reader.get_head(), ('in-worktree', git_output(self.worktree, 'rev-parse', 'HEAD')))
+        # Refs and config are shared with the main repository
+        self.assertResolves(reader, 'refs/heads/master', self.worktree)
+        self.assertEqual(reader.get_remotes(), RefReader(self.repo).get_remotes())
+
+    def test_relative_gitfile(self):
+        linked = path.join(self.root, 'linked')
+        makedirs(linked)
+        with open(path.join(linked, '.git'), 'w') as stream:
+            stream.write('gitdir: %s\n' % path.relpath(path.join(self.repo, '.git'), linked))
+        self.assertEqual(RefReader.get_git_dir(linked), path.join(self.repo, '.git'))
+
+    def test_config(self):
+        reader = RefReader(self.repo)
+        self.assertEqual(reader.get_remotes(), git_output(self.repo, 'remote').split('\n'))
+        for remote in reader.get_remotes():
+            self.assertEqual(reader.get_remote_url(remote), git_output(self.repo, 'remote', 'get-url', remote))
+        self.assertEqual(reader.get_upstream('feature-0'), ('origin', 'master'))
+        self.assertEqual(reader.get_upstream('master'), ('origin', 'master'))
+        self.assertEqual(reader.get_upstream('feature-1'), (None, None))
+
+    def test_parse_config(self):
+        config = RefReader._parse_config('\n'.join([
+            '# comment', '[core]', '\tbare = false', '[remote "origin"]', '\tURL = "git@host:repo.git"',
+            '; comment', '[branch.old-style]', '\tremote = origin', '\tmerge = refs/heads/master']))
+        self.assertEqual(config['sections'], [('core', None), ('remote', 'origin'), ('branch', 'old-style')])
+        self.assertEqual(config['values'][('remote', 'origin', 'url')], 'git@host:repo.git')
+        self.assertEqual(config['values'][('branch', 'old-style', 'merge')], 'refs/heads/master')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from os import path
+import sys
+
+MGIT_DIR = path.dirname(path.dirname(path.realpath(__file__)))
+sys.path.insert(0, MGIT_DIR)
+
+from libs.status import WorkingTreeStatus
+
+# Captured `git status --porcelain=v2 --branch` outputs
+MERGING = '\n'.join([
+    '# branch.oid f352687016e97ddd56fab290b42fd4e3ddd63486',
+    '# branch.head master',
+    '1 MM N... 100644 100644 100644 28ce6a8b26aa170e1de65536fe8abe1832bd3242 '
+    'b107cd5be5b8554862275dd2ffb0d77b134a25d2 both.txt',
+    '1 .D N... 100644 100644 000000 4bcfe98e640c8284511312660fb8709b0afa888e '
+    '4bcfe98e640c8284511312660fb8709b0afa888e deleted.txt',
+    '2 R. N... 100644 100644 100644 587be6b4c3f93f93c489c0111bba5596147a26cb '
+    '587be6b4c3f93f93c489c0111bba5596147a26cb R100 new name.txt\told name.txt',
+    'u UU N... 100644 100644 100644 100644 78981922613b2afb6025042ff6bd878ac1994e85 '
+    'f2ad6c76f0115a6ba5b00456a849810e7ec0af20 61780798228d17af2d34fce4cfbdf35556832472 conflict.txt',
+    '? untracked file.txt',
+    ''])
+TRACKING = '\n'.join([
+    '# branch.oid c6ba5faa5930423ffe12b96a49125e556c985a79',
+    '# branch.head feature/login',
+    '# branch.upstream origin/feature/login',
+    '# branch.ab +1 -12',
+    ''])
+DETACHED = '\n'.join([
+    '# branch.oid f352687016e97ddd56fab290b42fd4e3ddd63486',
+    '# branch.head (detached)',
+    ''])
+INITIAL = '\n'.join([
+    '# branch.oid (initial)',
+    '# branch.head master',
+    ''])
+
+
+class WorkingTreeStatusTest(unittest.TestCase):
+    def test_change_records(self):
+        status = WorkingTreeStatus.parse(MERGING)
+        # "1 MM" counts on both sides, "1 .D" is unstaged only, the "2 R." rename with its original
+        # path after the tab is a single staged change
+        self.assertEqual((status.staged, status.unstaged, status.untracked, status.conflicts), (2, 2, 1, 1))
+        self.assertEqual(status.branch, 'master')
+        self.assertTrue(status.is_dirty())
+
+    def test_no_upstream(self):
+        status = WorkingTreeStatus.parse(MERGING)
+        self.assertEqual((status.upstream, status.ahead, status.behind), (None, None, None))
+        self.assertTrue(str(status).startswith('no upstream: 2 staged, 2 unstaged, 1 untracked'))
+
+    def test_branch_ahead_behind(self):
+        status = WorkingTreeStatus.parse(TRACKING)
+        self.assertEqual((status.branch, status.upstream, status.ahead, status.behind),
+                         ('feature/login', 'origin/feature/login', 1, 12))
+        self.assertFalse(status.is_dirty())
+        self.assertEqual(str(status), 'origin/feature/login [+1 -12]: 0 staged, 0 unstaged, 0 untracked')
+
+    def test_detached_head(self):
+        status = WorkingTreeStatus.parse(DETACHED)
+        self.assertIsNone(status.branch)
+        self.assertFalse(status.is_dirty())
+
+    def test_repository_without_commits(self):
+        status = WorkingTreeStatus.parse(INITIAL)
+        self.assertEqual((status.branch, status.ahead), ('master', None))
+
+    def test_to_dict(self):
+        self.assertEqual(WorkingTreeStatus.parse(TRACKING).to_dict(), {
+            'branch': 'feature/login', 'upstream': 'origin/feature/login', 'ahead': 1, 'behind': 12, 'staged': 0,
+            'unstaged': 0, 'untracked': 0, 'conflicts': 0, 'notes': []})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import shutil
+import tempfile
+import unittest
+from os import path
+import sys
+
+MGIT_DIR = path.dirname(path.dirname(path.realpath(__file__)))
+sys.path.insert(0, MGIT_DIR)
+sys.path.insert(0, path.join(MGIT_DIR, 'benchmarks'))
+
+from generate_workspace import generate_workspace
+from libs import timeline
+from libs.timeline import merge_logs
+from libs.package import Package
+
+
+class MergeLogsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp(prefix='mgit-timeline-')
+        workspace = generate_workspace(cls.root, 4, depth=10, branches=0)
+        cls.packages = [Package(path.join(workspace, 'repo-%03d' % i)) for i in range(4)]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+
+    def merge(self, n=None, since=None, jobs=None):
+        entries, streams = merge_logs(self.packages, ['HEAD'] * len(self.packages), n, since, jobs)
+        entries = list(entries)
+        self.assertEqual([stream.close() for stream in streams], [None] * len(streams))
+        return entries
+
+    def test_limits_the_whole_timeline(self):
+        entries = self.merge(n=7)
+        self.assertEqual(len(entries), 7)
+        self.assertEqual(entries, sorted(entries, key=lambda entry: -entry[0]))
+
+    def test_buffered_chunks_match_the_streamed_logs(self):
+        streamed = self.merge(since='30 years ago')
+        self.assertEqual(len(streamed), 40)
+        chunk, timeline.LOG_CHUNK = timeline.LOG_CHUNK, 3
+        try:
+            self.assertEqual(self.merge(since='30 years ago', jobs=2), streamed)
+            self.assertEqual(self.merge(n=12, jobs=2), streamed[:12])
+        finally:
+            timeline.LOG_CHUNK = chunk
+
+
+if __name__ == '__main__':
+    unittest.main()